@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import aiohttp
+
+import metrics
+from worker_pool import WorkerPool
+
+# MIRROR_ATTACHMENTS=1 keeps local copies of monitored users' attachments
+MIRROR_ENABLED = os.getenv("MIRROR_ATTACHMENTS") == "1"
+MIRROR_DIR = os.getenv("MIRROR_DIR", "attachments")
+
+# Largest single attachment mirrored, and the most all mirrored files may take up
+MIRROR_MAX_FILE_BYTES = int(os.getenv("MIRROR_MAX_FILE_BYTES", str(25 * 1024 * 1024)))
+MIRROR_QUOTA_BYTES = int(os.getenv("MIRROR_QUOTA_BYTES", str(1024 * 1024 * 1024)))
+
+# Downloads running at once, and attachments allowed to wait for one
+MIRROR_CONCURRENCY = 3
+MIRROR_MAX_QUEUED = 500
+
+# Bytes read from the network and written to disk at a time
+CHUNK_SIZE = 64 * 1024
+
+# Seconds a single download may take
+DOWNLOAD_TIMEOUT = 120
+
+# Temporary files untouched this long are leftovers of a crash, not downloads in progress
+STALE_TMP_SECONDS = 2 * DOWNLOAD_TIMEOUT
+
+MIRRORED = metrics.counter("tracker_attachments_mirrored_total", "Attachments handled by the mirror, by outcome", ["result"])
+DOWNLOAD_SECONDS = metrics.histogram("tracker_attachment_download_seconds", "Attachment download and store time")
+
+
+class AttachmentTooLarge(Exception):
+    """Raised when a download turns out bigger than the per-file limit"""
+
+
+class AttachmentMirror:
+    """Content-addressed local copies of monitored users' attachments
+
+    mirror() only queues work. Downloads run on a small worker pool and are
+    streamed to a temporary file in chunks while being hashed, so a file is
+    never held in memory. The finished file is stored once under its
+    sha256 (objects/ab/cd/<digest>), and an index maps message IDs to
+    digests. Files past MIRROR_MAX_FILE_BYTES or beyond the total quota
+    are skipped.
+    """
+
+    def __init__(self, root=MIRROR_DIR, max_file_bytes=MIRROR_MAX_FILE_BYTES, quota_bytes=MIRROR_QUOTA_BYTES,
+                 concurrency=MIRROR_CONCURRENCY, max_queued=MIRROR_MAX_QUEUED):
+        self.root = root
+        self.max_file_bytes = max_file_bytes
+        self.quota_bytes = quota_bytes
+        self._pool = WorkerPool("attachment mirror", concurrency, max_queued)
+        self._session = None
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(root, "tmp"), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # Bot processes running shard ranges share the directory and its index
+        self._db.execute("PRAGMA busy_timeout=5000")
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS objects (sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL) WITHOUT ROWID")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS attachments ("
+                "message_id INTEGER NOT NULL, attachment_id INTEGER NOT NULL, filename TEXT NOT NULL, "
+                "sha256 TEXT NOT NULL, mirrored_at INTEGER NOT NULL, "
+                "PRIMARY KEY (message_id, attachment_id)) WITHOUT ROWID"
+            )
+        # Reads get their own connection: in WAL mode they never wait for writers, so
+        # lookup() can run on the event loop while _store() holds a write transaction
+        self._read_lock = threading.Lock()
+        self._reader = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False)
+        self._reader.execute("PRAGMA query_only=ON")
+        self.used_bytes = self._read_used_bytes()
+        # Bytes promised to this process's downloads still running, so they can't overshoot the quota together
+        self._reserved = 0
+        self.stored = 0
+        self.duplicates = 0
+        self.skipped = 0
+        self.failed = 0
+
+        # Leftovers of downloads interrupted by a crash. Other processes' downloads
+        # in progress are written to all the time, so recent files are left alone.
+        cutoff = time.time() - STALE_TMP_SECONDS
+        for name in os.listdir(os.path.join(root, "tmp")):
+            path = os.path.join(root, "tmp", name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def start(self):
+        """Start the download workers (needs a running event loop)"""
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT))
+        self._pool.start()
+
+    def mirror(self, message):
+        """Queue a message's attachments for download (never waits)"""
+        for attachment in message.attachments:
+            if attachment.size > self.max_file_bytes:
+                self._skip("too_large")
+                continue
+            if not self._pool.submit(self._download, message.id, attachment):
+                self._skip("queue_full")
+
+    def _skip(self, reason):
+        self.skipped += 1
+        MIRRORED.labels(reason).inc()
+
+    def object_path(self, digest):
+        return os.path.join(self.root, "objects", digest[:2], digest[2:4], digest)
+
+    def lookup(self, message_id):
+        """Return [(filename, path)] of a message's mirrored attachments"""
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT filename, sha256 FROM attachments WHERE message_id = ? ORDER BY attachment_id", (message_id,)
+            ).fetchall()
+        return [(filename, self.object_path(digest)) for filename, digest in rows]
+
+    def _read_used_bytes(self):
+        with self._read_lock:
+            return self._reader.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+    async def _download(self, message_id, attachment):
+        # Other processes store into the same directory, so read the total they left
+        self.used_bytes = await asyncio.to_thread(self._read_used_bytes)
+        if self.used_bytes + self._reserved + attachment.size > self.quota_bytes:
+            self._skip("quota")
+            return
+        self._reserved += attachment.size
+        started = time.perf_counter()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.root, "tmp"))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                digest, size = await self._stream(attachment.url, f)
+            result = await asyncio.to_thread(self._store, tmp_path, digest, size, message_id, attachment)
+        except AttachmentTooLarge:
+            self._skip("too_large")
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, sqlite3.Error) as e:
+            self.failed += 1
+            MIRRORED.labels("error").inc()
+            print(f"Error mirroring attachment {attachment.filename} of message {message_id}: {e}")
+        else:
+            if result == "quota":
+                self._skip("quota")
+                return
+            if result == "stored":
+                self.stored += 1
+            else:
+                self.duplicates += 1
+            MIRRORED.labels(result).inc()
+            DOWNLOAD_SECONDS.observe(time.perf_counter() - started)
+        finally:
+            self._reserved -= attachment.size
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+
+    async def _stream(self, url, f):
+        """Download url into f chunk by chunk, returns (sha256 hex digest, size)"""
+        sha256 = hashlib.sha256()
+        size = 0
+        async with self._session.get(url) as response:
+            response.raise_for_status()
+            if (response.content_length or 0) > self.max_file_bytes:
+                raise AttachmentTooLarge()
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                size += len(chunk)
+                if size > self.max_file_bytes:
+                    raise AttachmentTooLarge()
+                # Hashing and writing happen off the event loop
+                await asyncio.to_thread(self._write_chunk, f, sha256, chunk)
+        return sha256.hexdigest(), size
+
+    @staticmethod
+    def _write_chunk(f, sha256, chunk):
+        sha256.update(chunk)
+        f.write(chunk)
+
+    def _store(self, tmp_path, digest, size, message_id, attachment):
+        """Move a finished download into place unless the same content is stored already
+
+        Returns "stored", "duplicate" or "quota". The quota check and the
+        insert share one write transaction, so processes sharing the index
+        can't fill it past the quota between them.
+        """
+        path = self.object_path(digest)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                known = self._db.execute("SELECT 1 FROM objects WHERE sha256 = ?", (digest,)).fetchone() is not None
+                if not known:
+                    used = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+                    if used + size > self.quota_bytes:
+                        self._db.rollback()
+                        self.used_bytes = used
+                        return "quota"
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(tmp_path, path)
+                    self._db.execute("INSERT INTO objects (sha256, size) VALUES (?, ?)", (digest, size))
+                    self.used_bytes = used + size
+                self._db.execute(
+                    "INSERT OR REPLACE INTO attachments (message_id, attachment_id, filename, sha256, mirrored_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (message_id, attachment.id, attachment.filename, digest, int(time.time())),
+                )
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                raise
+        return "duplicate" if known else "stored"
+
+    def stats(self):
+        return {
+            "queued": self._pool.stats()["queued"],
+            "stored": self.stored,
+            "duplicates": self.duplicates,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "used_bytes": self.used_bytes,
+            "quota_bytes": self.quota_bytes,
+        }
+
+    async def close(self):
+        """Let queued downloads finish briefly, then release the session and index"""
+        await self._pool.close()
+        if self._session is not None:
+            await self._session.close()
+        with self._lock:
+            self._db.close()
+        with self._read_lock:
+            self._reader.close()
@@ -0,0 +1,317 @@
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# Load test: drives the real handlers in main.py with synthetic guilds,
+# users and message streams. Messages are built by discord.py itself from
+# gateway-shaped payloads, and every REST call the library makes (command
+# replies, log channel sends, fetch_user) goes to a local fake Discord API.
+# Each watchlist size / guild count combination runs in its own process and
+# temporary directory, so nothing touches the real watchlist.
+
+parser = argparse.ArgumentParser(description="Measure handler latency and throughput against a local fake Discord")
+parser.add_argument("--guilds", default="1,10,100", help="comma-separated guild counts to sweep")
+parser.add_argument("--watched", default="10,100,1000", help="comma-separated monitored users per guild to sweep")
+parser.add_argument("--messages", type=int, default=50000, help="messages to replay per run")
+parser.add_argument("--hit-rate", type=float, default=0.005, help="share of messages from monitored users")
+parser.add_argument("--authors", type=int, default=50000, help="distinct unmonitored message authors")
+parser.add_argument("--monitor-commands", type=int, default=200, help="!monitor_id commands per run")
+parser.add_argument("--list-commands", type=int, default=50, help="!monitored commands per run")
+parser.add_argument("--http-latency", type=float, default=0.0, help="milliseconds the fake API waits before answering")
+parser.add_argument("--backend", choices=["json", "sqlite"], default="json", help="watchlist storage backend")
+parser.add_argument("--run", nargs=2, type=int, metavar=("GUILDS", "WATCHED"), help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+BOT_ID = 6 * 10**17
+MODERATOR_ID = 5 * 10**17
+EPOCH = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def guild_id(index):
+    return 10**17 + index
+
+
+def watched_user_id(index, n):
+    return 2 * 10**17 + index * 10**6 + n
+
+
+def user_payload(user_id, bot=False):
+    return {"id": str(user_id), "username": f"user{user_id % 10**6}", "discriminator": "0", "global_name": None, "avatar": None, "bot": bot}
+
+
+def member_payload(user_id, roles=()):
+    return {"user": user_payload(user_id), "roles": [str(role) for role in roles], "joined_at": EPOCH.isoformat(), "deaf": False, "mute": False, "flags": 0}
+
+
+def guild_payload(index):
+    gid = guild_id(index)
+    channels = [
+        {"id": str(gid + 4 * 10**17), "type": 0, "name": "general", "position": 0, "permission_overwrites": []},
+        {"id": str(gid + 8 * 10**17), "type": 0, "name": "tracked-users", "position": 1, "permission_overwrites": []},
+    ]
+    roles = [
+        {"id": str(gid), "name": "@everyone", "permissions": "0", "position": 0, "color": 0, "hoist": False, "managed": False, "mentionable": False},
+        # Administrator, so the moderator passes every permission check
+        {"id": str(gid + 7 * 10**17), "name": "Moderators", "permissions": "8", "position": 1, "color": 0, "hoist": False, "managed": False, "mentionable": False},
+    ]
+    members = [member_payload(BOT_ID, [gid + 7 * 10**17]), member_payload(MODERATOR_ID, [gid + 7 * 10**17])]
+    members[0]["user"]["bot"] = True
+    return {
+        "id": str(gid), "name": f"Guild {index}", "owner_id": str(MODERATOR_ID), "roles": roles, "channels": channels,
+        "members": members, "member_count": 1000, "features": [], "emojis": [], "stickers": [], "large": True,
+    }
+
+
+class FakeDiscordAPI:
+    """Just enough of the Discord REST API for the bot's handlers, answered locally"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.requests = 0
+        self.messages_posted = 0
+        self.embeds_posted = 0
+        self.users_fetched = 0
+        # Replies with an error embed, a run with any of these measured the wrong thing
+        self.error_replies = []
+        self._next_id = itertools.count(9 * 10**17)
+
+    async def start(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_route("*", "/api/v10/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        await self._runner.cleanup()
+
+    def _json(self, payload, status=200, headers=None):
+        from aiohttp import web
+        # discord.py only decodes bodies whose content type is exactly application/json
+        response = web.Response(text=json.dumps(payload), status=status, headers=headers)
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    async def _handle(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        path = request.match_info["path"].split("/")
+        headers = {
+            # Roomy limits, the library should never have to wait on the fake API
+            "X-RateLimit-Limit": "50", "X-RateLimit-Remaining": "49", "X-RateLimit-Reset-After": "1.0",
+            "X-RateLimit-Bucket": "-".join(part for part in path if not part.isdigit()),
+        }
+
+        if request.method == "GET" and path == ["users", "@me"]:
+            return self._json(user_payload(BOT_ID, bot=True), headers=headers)
+        if request.method == "GET" and path == ["oauth2", "applications", "@me"]:
+            return self._json({
+                "id": str(BOT_ID), "name": "user-tracker", "description": "", "icon": None, "bot_public": False,
+                "bot_require_code_grant": False, "owner": user_payload(MODERATOR_ID), "verify_key": "", "flags": 0,
+            }, headers=headers)
+        if request.method == "GET" and len(path) == 2 and path[0] == "users" and path[1].isdigit():
+            self.users_fetched += 1
+            return self._json(user_payload(int(path[1])), headers=headers)
+        if request.method == "POST" and len(path) == 3 and path[0] == "channels" and path[2] == "messages":
+            body = await request.json()
+            self.messages_posted += 1
+            self.embeds_posted += len(body.get("embeds") or [])
+            for embed in body.get("embeds") or []:
+                if embed.get("title", "").startswith("❌"):
+                    self.error_replies.append(f"{embed['title']}: {embed.get('description', '')}")
+            return self._json({
+                "id": str(next(self._next_id)), "channel_id": path[1], "author": user_payload(BOT_ID, bot=True),
+                "content": body.get("content") or "", "embeds": body.get("embeds") or [], "attachments": [],
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(), "edited_timestamp": None,
+                "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [], "pinned": False, "type": 0,
+                "components": body.get("components") or [],
+            }, headers=headers)
+        return self._json({"message": "404: Not Found", "code": 0}, status=404, headers=headers)
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def summarize(samples):
+    return {"count": len(samples), "p50": percentile(samples, 0.5), "p99": percentile(samples, 0.99)}
+
+
+async def run_config(guild_count, watched_per_guild):
+    import discord
+    import main
+
+    api = FakeDiscordAPI(args.http_latency / 1000)
+    port = await api.start()
+    discord.http.Route.BASE = f"http://127.0.0.1:{port}/api/v10"
+
+    bot = main.bot
+    await bot.login("fake-token")
+    state = bot._connection
+    guilds = [state._add_guild_from_data(guild_payload(index)) for index in range(guild_count)]
+
+    random.seed(1234)
+    message_ids = itertools.count(3 * 10**18)
+
+    def make_message(guild, author_id, content):
+        general = guild.text_channels[0]
+        data = {
+            "id": str(next(message_ids)), "channel_id": str(general.id), "guild_id": str(guild.id),
+            "author": user_payload(author_id), "member": member_payload(author_id, [guild.id + 7 * 10**17] if author_id == MODERATOR_ID else []),
+            "content": content, "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(), "edited_timestamp": None,
+            "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [], "attachments": [], "embeds": [],
+            "pinned": False, "type": 0,
+        }
+        # The same conversion the gateway's MESSAGE_CREATE handler does
+        return discord.Message(state=state, channel=general, data=data)
+
+    async def timed(message):
+        started = time.perf_counter()
+        await main.on_message(message)
+        return time.perf_counter() - started
+
+    # Plain message stream
+    message_latencies = []
+    guild_indexes = range(guild_count)
+    for n in range(args.messages):
+        index = random.choice(guild_indexes)
+        if random.random() < args.hit_rate:
+            author_id = watched_user_id(index, random.randrange(watched_per_guild))
+        else:
+            author_id = 3 * 10**17 + random.randrange(args.authors)
+        message_latencies.append(await timed(make_message(guilds[index], author_id, f"just chatting {n}")))
+        # Let the monitoring workers and log relay run between gateway events
+        await asyncio.sleep(0)
+
+    # Log pipeline: how long the queued monitored messages take to reach the fake log channels
+    drain_started = time.perf_counter()
+    while main.monitor_pool.stats()["queued"] or main.monitor_pool.stats()["busy"] or main.log_relay.queued():
+        await asyncio.sleep(0.01)
+    drain_seconds = time.perf_counter() - drain_started
+
+    # Commands, answered through the fake API
+    monitor_latencies = []
+    for n in range(args.monitor_commands):
+        index = random.choice(guild_indexes)
+        new_user = watched_user_id(index, watched_per_guild + n)
+        monitor_latencies.append(await timed(make_message(guilds[index], MODERATOR_ID, f"!monitor_id {new_user}")))
+    list_latencies = []
+    for n in range(args.list_commands):
+        index = random.choice(guild_indexes)
+        list_latencies.append(await timed(make_message(guilds[index], MODERATOR_ID, "!monitored")))
+
+    close_started = time.perf_counter()
+    await bot.close()
+    close_seconds = time.perf_counter() - close_started
+    await api.close()
+
+    total = sum(message_latencies)
+    return {
+        "guilds": guild_count,
+        "watched": watched_per_guild,
+        "messages_per_second": len(message_latencies) / total if total else 0.0,
+        "on_message": summarize(message_latencies),
+        "monitor_id": summarize(monitor_latencies),
+        "monitored": summarize(list_latencies),
+        "log_drain_seconds": drain_seconds,
+        "log_messages": main.log_relay.sent_messages,
+        "log_embeds": main.log_relay.sent_embeds,
+        "log_dropped": main.log_relay.dropped_embeds + main.monitor_pool.dropped,
+        "users_fetched": api.users_fetched,
+        "error_replies": api.error_replies[:5],
+        "http_requests": api.requests,
+        "close_seconds": close_seconds,
+    }
+
+
+def run_single(guild_count, watched_per_guild):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp(prefix="bench_load."))
+    watchlist = {
+        guild_id(index): [watched_user_id(index, n) for n in range(watched_per_guild)]
+        for index in range(guild_count)
+    }
+    if args.backend == "sqlite":
+        from storage import DATABASE_FILE, SqliteStore
+        store = SqliteStore(DATABASE_FILE)
+        store.import_watchlist(watchlist)
+        store.close()
+    else:
+        with open("monitored_users.json", "w") as f:
+            json.dump({str(g): [str(u) for u in users] for g, users in watchlist.items()}, f)
+
+    result = asyncio.run(run_config(guild_count, watched_per_guild))
+    print("RESULT " + json.dumps(result))
+
+
+def us(seconds):
+    return f"{seconds * 1e6:,.0f}"
+
+
+def ms(seconds):
+    return f"{seconds * 1e3:,.1f}"
+
+
+def run_sweep():
+    env = dict(os.environ, METRICS_PORT="0", WATCHLIST_BACKEND=args.backend, LOW_MEMORY="0", SHARDED="0")
+    env.pop("SHARD_IDS", None)
+    passthrough = [
+        "--messages", str(args.messages), "--hit-rate", str(args.hit_rate), "--authors", str(args.authors),
+        "--monitor-commands", str(args.monitor_commands), "--list-commands", str(args.list_commands),
+        "--http-latency", str(args.http_latency), "--backend", args.backend,
+    ]
+
+    print("Load Test (fake gateway + fake REST API)")
+    print("=" * 40)
+    print(f"{args.messages:,} messages per run, hit rate {args.hit_rate:.2%}, {args.backend} watchlist, "
+          f"{args.http_latency:g} ms API latency")
+    header = (
+        f"{'guilds':>7} {'watched':>8} {'msg/s':>10} {'msg p50us':>10} {'msg p99us':>10} "
+        f"{'mon p50ms':>10} {'mon p99ms':>10} {'list p50ms':>11} {'list p99ms':>11} {'log sends':>10} {'drain s':>8} {'close s':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for guild_count in map(int, args.guilds.split(",")):
+        for watched_per_guild in map(int, args.watched.split(",")):
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", str(guild_count), str(watched_per_guild)] + passthrough,
+                env=env, capture_output=True, text=True,
+            )
+            lines = [line for line in process.stdout.splitlines() if line.startswith("RESULT ")]
+            if process.returncode or not lines:
+                print(f"{guild_count:>7} {watched_per_guild:>8} failed:")
+                print(process.stderr.strip() or process.stdout.strip())
+                continue
+            r = json.loads(lines[-1][len("RESULT "):])
+            print(
+                f"{r['guilds']:>7} {r['watched']:>8} {r['messages_per_second']:>10,.0f} "
+                f"{us(r['on_message']['p50']):>10} {us(r['on_message']['p99']):>10} "
+                f"{ms(r['monitor_id']['p50']):>10} {ms(r['monitor_id']['p99']):>10} "
+                f"{ms(r['monitored']['p50']):>11} {ms(r['monitored']['p99']):>11} "
+                f"{r['log_messages']:>10,} {r['log_drain_seconds']:>8.2f} {r['close_seconds']:>8.2f}"
+            )
+            if r["log_dropped"]:
+                print(f"{'':>16} {r['log_dropped']:,} monitored messages dropped")
+            for reply in r["error_replies"]:
+                print(f"{'':>16} error reply: {reply}")
+
+
+if args.run:
+    run_single(*args.run)
+else:
+    run_sweep()
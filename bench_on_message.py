@@ -0,0 +1,152 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Microbenchmark: replay a synthetic message stream through on_message and
+# compare it with the original handler, which re-read monitored_users.json
+# for every message. Runs in a temporary directory so it never touches the
+# real watchlist.
+
+parser = argparse.ArgumentParser(description="Measure on_message throughput on a synthetic message stream")
+parser.add_argument("--messages", type=int, default=200000, help="messages to replay")
+parser.add_argument("--guilds", type=int, default=50, help="guilds in the watchlist")
+parser.add_argument("--watched", type=int, default=20, help="monitored users per guild")
+parser.add_argument("--authors", type=int, default=100000, help="distinct message authors")
+parser.add_argument("--hit-rate", type=float, default=0.001, help="share of messages from monitored users")
+parser.add_argument("--rules", type=int, default=0, help="watch rules (keywords) per guild")
+parser.add_argument("--legacy-messages", type=int, default=5000, help="messages to replay through the original handler")
+args = parser.parse_args()
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp(prefix="bench_on_message."))
+
+random.seed(1234)
+guild_ids = [10**17 + guild for guild in range(args.guilds)]
+watched = {
+    guild_id: [2 * 10**17 + index * args.watched + n for n in range(args.watched)]
+    for index, guild_id in enumerate(guild_ids)
+}
+with open("monitored_users.json", "w") as f:
+    json.dump({str(g): [str(u) for u in users] for g, users in watched.items()}, f)
+with open("watch_rules.json", "w") as f:
+    json.dump({
+        str(guild_id): [
+            {"id": n + 1, "kind": "word", "pattern": f"scam phrase {n:04d}", "by": None, "ts": 0}
+            for n in range(args.rules)
+        ]
+        for guild_id in guild_ids if args.rules
+    }, f)
+
+import main  # noqa: E402  (loads the watchlist and rules written above)
+
+
+class FakeAuthor:
+    __slots__ = ("id", "bot")
+
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = False
+
+
+class FakeGuild:
+    __slots__ = ("id",)
+
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+
+class FakeChannel:
+    __slots__ = ("id",)
+
+    def __init__(self, channel_id):
+        self.id = channel_id
+
+
+class FakeMessage:
+    __slots__ = ("id", "author", "guild", "channel", "content", "attachments", "created_at")
+
+    def __init__(self, message_id, author, guild):
+        self.id = message_id
+        self.author = author
+        self.guild = guild
+        self.channel = FakeChannel(guild.id)
+        self.content = "just chatting about the game last night, anyone up for another round later?"
+        self.attachments = []
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+
+
+def build_stream(count):
+    guilds = [FakeGuild(guild_id) for guild_id in guild_ids]
+    authors = [FakeAuthor(3 * 10**17 + n) for n in range(args.authors)]
+    stream = []
+    for n in range(count):
+        guild = random.choice(guilds)
+        if random.random() < args.hit_rate:
+            author = FakeAuthor(random.choice(watched[guild.id]))
+        else:
+            author = random.choice(authors)
+        stream.append(FakeMessage(n, author, guild))
+    return stream
+
+
+def legacy_is_monitored(message):
+    """The original per-message check: open and parse the whole file, then a list scan"""
+    with open("monitored_users.json") as f:
+        data = json.load(f)
+    guild_id = str(message.guild.id)
+    return guild_id in data and str(message.author.id) in data[guild_id]
+
+
+async def noop_process_commands(message):
+    pass
+
+
+async def replay(handler, stream):
+    started = time.perf_counter()
+    for message in stream:
+        await handler(message)
+    return time.perf_counter() - started
+
+
+async def legacy_on_message(message):
+    if message.author.bot:
+        return
+    if not message.guild:
+        return
+    legacy_is_monitored(message)
+    await main.bot.process_commands(message)
+
+
+async def run():
+    # Only on_message's own cost is measured, command parsing is not part of it
+    main.bot.process_commands = noop_process_commands
+    # Monitored messages are queued for the (not running) workers, keep the queue from filling up
+    main.monitor_pool = main.WorkerPool("bench", 1, args.messages + 1)
+
+    legacy_stream = build_stream(args.legacy_messages)
+    stream = build_stream(args.messages)
+
+    legacy_seconds = await replay(legacy_on_message, legacy_stream)
+    # Warm up, then measure
+    await replay(main.on_message, stream[:10000])
+    seconds = await replay(main.on_message, stream)
+
+    legacy_rate = len(legacy_stream) / legacy_seconds
+    rate = len(stream) / seconds
+    print("on_message Microbenchmark")
+    print("=" * 40)
+    print(f"Watchlist: {args.guilds} guilds x {args.watched} users, hit rate {args.hit_rate:.2%}")
+    print(f"Watch rules: {args.rules} per guild")
+    print(f"Before (file load per message): {legacy_rate:>12,.0f} msg/s  {1e9 / legacy_rate:>10,.0f} ns/msg")
+    print(f"After  (fast reject):           {rate:>12,.0f} msg/s  {1e9 / rate:>10,.0f} ns/msg")
+    print(f"Speedup: {rate / legacy_rate:,.0f}x")
+    print(f"Monitored messages queued for logging: {main.monitor_pool.stats()['queued']}")
+
+
+asyncio.run(run())
@@ -1,25 +1,128 @@
+"""Report the bot's watchlist without starting the bot
+
+Safe to run while the bot is running (from cron, for example): the
+watchlist is streamed from one consistent view of the store, never loaded
+whole, and nothing is written.
+
+    python check_watchlist.py                  # totals and the largest servers
+    python check_watchlist.py --format guilds  # one line per server
+    python check_watchlist.py --format csv -o watchlist.csv
+"""
+import argparse
+import csv
+import heapq
+import itertools
 import json
 import os
-import discord
-from discord.ext import commands
+import sys
+
+from storage import WatchlistLoadError, open_store
 
-# Load the monitored users data
-with open("monitored_users.json", "r") as f:
-    data = json.load(f)
 
-print("Discord Bot Watchlist Status")
-print("=" * 40)
+def iter_guilds(pairs):
+    """Group streamed (guild_id, user_id) pairs into (guild_id, [user_id, ...])"""
+    for guild_id, group in itertools.groupby(pairs, key=lambda pair: pair[0]):
+        yield guild_id, [user_id for _, user_id in group]
 
-if not data:
-    print("No users are currently being monitored.")
-else:
+
+def write_summary(pairs, out, top):
+    # Only counts are kept, so memory stays flat however large the watchlist is
     total_users = 0
-    for guild_id, user_list in data.items():
-        print(f"\nServer ID: {guild_id}")
-        print(f"Monitored Users: {len(user_list)}")
-        for user_id in user_list:
-            print(f"  - User ID: {user_id}")
-            total_users += 1
-    
-    print(f"\nTotal monitored users across all servers: {total_users}")
-    print(f"Total servers with monitored users: {len(data)}")
\ No newline at end of file
+    total_guilds = 0
+    largest = []
+    for guild_id, group in itertools.groupby(pairs, key=lambda pair: pair[0]):
+        count = sum(1 for _ in group)
+        total_users += count
+        total_guilds += 1
+        if top:
+            if len(largest) < top:
+                heapq.heappush(largest, (count, guild_id))
+            else:
+                heapq.heappushpop(largest, (count, guild_id))
+
+    out.write("Discord Bot Watchlist Status\n")
+    out.write("=" * 40 + "\n")
+    if not total_users:
+        out.write("No users are currently being monitored.\n")
+        return
+    if largest:
+        out.write(f"\nLargest servers (top {len(largest)}):\n")
+        for count, guild_id in sorted(largest, reverse=True):
+            out.write(f"  Server ID: {guild_id}  Monitored Users: {count}\n")
+    out.write(f"\nTotal monitored users across all servers: {total_users}\n")
+    out.write(f"Total servers with monitored users: {total_guilds}\n")
+
+
+def write_guilds(pairs, out):
+    out.write("guild_id\tusers\n")
+    for guild_id, group in itertools.groupby(pairs, key=lambda pair: pair[0]):
+        out.write(f"{guild_id}\t{sum(1 for _ in group)}\n")
+
+
+def write_json(pairs, out):
+    # Same {"guild_id": ["user_id", ...]} layout as monitored_users.json, one guild at a time
+    out.write("{")
+    for index, (guild_id, user_ids) in enumerate(iter_guilds(pairs)):
+        if index:
+            out.write(",")
+        out.write(f"\n{json.dumps(str(guild_id))}:{json.dumps([str(user_id) for user_id in user_ids])}")
+    out.write("\n}\n")
+
+
+def write_csv(pairs, out):
+    writer = csv.writer(out)
+    writer.writerow(["guild_id", "user_id"])
+    writer.writerows(pairs)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Report the users the bot is monitoring")
+    parser.add_argument("--format", choices=["summary", "guilds", "json", "csv"], default="summary",
+                        help="summary: totals and largest servers, guilds: user count per server, "
+                             "json/csv: every monitored user")
+    parser.add_argument("--backend", choices=["json", "sqlite"], help="watchlist backend (default: WATCHLIST_BACKEND)")
+    parser.add_argument("--guild", type=int, action="append", help="only report this server (repeatable)")
+    parser.add_argument("--top", type=int, default=10, help="largest servers listed in the summary (0 for none)")
+    parser.add_argument("-o", "--output", help="write to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        store = open_store(args.backend, readonly=True)
+    except WatchlistLoadError as e:
+        print(f"Error reading watchlist: {e}", file=sys.stderr)
+        return 2
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        pairs = store.scan()
+        if args.guild:
+            guilds = set(args.guild)
+            pairs = (pair for pair in pairs if pair[0] in guilds)
+        if args.format == "summary":
+            write_summary(pairs, out, args.top)
+        elif args.format == "guilds":
+            write_guilds(pairs, out)
+        elif args.format == "json":
+            write_json(pairs, out)
+        else:
+            write_csv(pairs, out)
+        out.flush()
+    except WatchlistLoadError as e:
+        print(f"Error reading watchlist: {e}", file=sys.stderr)
+        return 2
+    except BrokenPipeError:
+        # Output piped into head and the like, stop quietly
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 0
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import asyncio
+import collections
+import time
+
+import discord
+
+import metrics
+from rest_scheduler import BACKGROUND, SchedulerBusy
+
+# Discord limits for a single message
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+MAX_DESCRIPTION_CHARS = 4096
+MAX_FIELD_VALUE_CHARS = 1024
+
+# Seconds to wait for more embeds before sending a partial batch
+BATCH_WINDOW = 1.0
+
+# Embeds a guild may have waiting before new ones are dropped
+MAX_QUEUED_EMBEDS = 500
+
+LOG_SENDS = metrics.counter("tracker_log_sends_total", "Log channel sends by result", ["result"])
+LOG_SEND_SECONDS = metrics.histogram("tracker_log_send_seconds", "Log channel send latency, including the channel lookup")
+LOG_EMBEDS_DROPPED = metrics.counter("tracker_log_embeds_dropped_total", "Log embeds dropped because a guild's queue was full")
+
+
+def fit_embed(embed, max_chars=MAX_EMBED_CHARS_PER_MESSAGE):
+    """Shorten an embed's longest texts until it fits Discord's limits"""
+    def cut(text, length):
+        return text if len(text) <= length else text[:max(length - 1, 1)] + "…"
+
+    if embed.description and len(embed.description) > MAX_DESCRIPTION_CHARS:
+        embed.description = cut(embed.description, MAX_DESCRIPTION_CHARS)
+    for index, field in enumerate(embed.fields):
+        if len(field.value) > MAX_FIELD_VALUE_CHARS:
+            embed.set_field_at(index, name=field.name, value=cut(field.value, MAX_FIELD_VALUE_CHARS), inline=field.inline)
+
+    excess = len(embed) - max_chars
+    if excess <= 0:
+        return embed
+    # Cut every text longer than a shared cap, the largest one that fits the budget
+    lengths = sorted([len(embed.description or "")] + [len(field.value) for field in embed.fields])
+    budget = sum(lengths) - excess
+    used = 0
+    cap = 0
+    for position, length in enumerate(lengths):
+        longer = len(lengths) - position
+        if used + length * longer > budget:
+            cap = (budget - used) // longer
+            break
+        used += length
+    if cap < 1:
+        # Titles and names alone are over the limit, let Discord reject it
+        return embed
+    if embed.description:
+        embed.description = cut(embed.description, cap)
+    for index, field in enumerate(embed.fields):
+        if len(field.value) > cap:
+            embed.set_field_at(index, name=field.name, value=cut(field.value, cap), inline=field.inline)
+    return embed
+
+
+class _GuildQueue:
+    __slots__ = ("guild", "embeds", "dropped", "full", "task")
+
+    def __init__(self, guild):
+        self.guild = guild
+        self.embeds = collections.deque()
+        # Embeds dropped since the last notice was posted
+        self.dropped = 0
+        self.full = asyncio.Event()
+        self.task = None
+
+
+class LogRelay:
+    """Per-guild queues of log embeds, packed into multi-embed sends
+
+    enqueue() never waits: a background task per guild collects embeds for
+    up to BATCH_WINDOW seconds and posts them ten at a time to the channel
+    returned by get_channel(guild). Sends go through the scheduler's
+    background lane; when it turns them away the batch is folded into the
+    next dropped-messages notice.
+    """
+
+    def __init__(self, get_channel, batch_window=BATCH_WINDOW, max_queued=MAX_QUEUED_EMBEDS, scheduler=None):
+        self._get_channel = get_channel
+        self._scheduler = scheduler
+        self._batch_window = batch_window
+        self._max_queued = max_queued
+        self._queues = {}
+        self._closing = False
+        self.sent_messages = 0
+        self.sent_embeds = 0
+        self.dropped_embeds = 0
+
+    def enqueue(self, guild, embed):
+        """Queue an embed for the guild's log channel, returns False if it had to be dropped"""
+        queue = self._queues.get(guild.id)
+        if queue is None:
+            queue = self._queues[guild.id] = _GuildQueue(guild)
+        queue.guild = guild
+
+        if len(queue.embeds) >= self._max_queued:
+            # Backpressure: the log channel can't keep up, count it and move on
+            queue.dropped += 1
+            self.dropped_embeds += 1
+            LOG_EMBEDS_DROPPED.inc()
+            return False
+
+        # An embed over Discord's limits would get the whole batch rejected
+        queue.embeds.append(fit_embed(embed))
+        if len(queue.embeds) >= MAX_EMBEDS_PER_MESSAGE:
+            queue.full.set()
+        if queue.task is None:
+            queue.task = asyncio.get_running_loop().create_task(self._drain(queue))
+        return True
+
+    def queued(self):
+        """Return the number of embeds waiting across all guilds"""
+        return sum(len(queue.embeds) for queue in self._queues.values())
+
+    async def _drain(self, queue):
+        try:
+            while queue.embeds:
+                if len(queue.embeds) < MAX_EMBEDS_PER_MESSAGE and not self._closing:
+                    # Give a burst a moment to fill up the batch
+                    try:
+                        await asyncio.wait_for(queue.full.wait(), self._batch_window)
+                    except asyncio.TimeoutError:
+                        pass
+                queue.full.clear()
+                await self._send_batch(queue)
+        finally:
+            queue.task = None
+            if not queue.embeds and not queue.dropped:
+                self._queues.pop(queue.guild.id, None)
+
+    async def _send_batch(self, queue):
+        batch = []
+        chars = 0
+        limit = MAX_EMBEDS_PER_MESSAGE
+        char_limit = MAX_EMBED_CHARS_PER_MESSAGE
+        if queue.dropped:
+            # Leave room for the dropped-messages notice
+            limit -= 1
+            char_limit -= 200
+
+        while queue.embeds and len(batch) < limit:
+            size = len(queue.embeds[0])
+            if batch and chars + size > char_limit:
+                break
+            batch.append(queue.embeds.popleft())
+            chars += size
+
+        logged = len(batch)
+        dropped = queue.dropped
+        if dropped:
+            batch.append(discord.Embed(
+                title="⚠️ Log Messages Dropped",
+                description=f"{dropped} monitored message(s) were not logged because the log queue was full.",
+                color=discord.Color.orange()
+            ))
+            queue.dropped = 0
+
+        started = time.perf_counter()
+        channel = None
+        try:
+            channel = await self._get_channel(queue.guild)
+            if channel is None:
+                LOG_SENDS.labels("no_channel").inc()
+                return
+            await self._post(channel, batch)
+            self.sent_messages += 1
+            self.sent_embeds += len(batch)
+            LOG_SENDS.labels("ok").inc()
+        except SchedulerBusy:
+            # Rate limits are saturated: summarize instead of retrying, the next notice carries the count
+            queue.dropped += dropped + logged
+            self.dropped_embeds += logged
+            LOG_EMBEDS_DROPPED.inc(logged)
+            LOG_SENDS.labels("deferred").inc()
+        except discord.HTTPException as e:
+            LOG_SENDS.labels("error").inc()
+            if e.status == 400 and channel is not None and len(batch) > 1:
+                # One bad embed fails the whole message, send them one by one so only it is lost
+                await self._send_each(queue, channel, batch, logged, dropped)
+            else:
+                print(f"Error logging monitored messages in {queue.guild.name}: {e}")
+        except Exception as e:
+            LOG_SENDS.labels("error").inc()
+            print(f"Error logging monitored messages in {queue.guild.name}: {e}")
+        finally:
+            LOG_SEND_SECONDS.observe(time.perf_counter() - started)
+
+    async def _post(self, channel, embeds):
+        if self._scheduler is not None:
+            await self._scheduler.run(BACKGROUND, "POST", f"/channels/{channel.id}/messages", channel.send, embeds=embeds)
+        else:
+            await channel.send(embeds=embeds)
+
+    async def _send_each(self, queue, channel, batch, logged, dropped):
+        """Resend a rejected batch one embed at a time (the dropped notice, if any, is last)"""
+        for index, embed in enumerate(batch):
+            try:
+                await self._post(channel, [embed])
+            except SchedulerBusy:
+                remaining = max(logged - index, 0)
+                queue.dropped += dropped + remaining
+                self.dropped_embeds += remaining
+                LOG_EMBEDS_DROPPED.inc(remaining)
+                LOG_SENDS.labels("deferred").inc()
+                return
+            except Exception as e:
+                LOG_SENDS.labels("error").inc()
+                print(f"Error logging a monitored message in {queue.guild.name}: {e}")
+                continue
+            self.sent_messages += 1
+            self.sent_embeds += 1
+            LOG_SENDS.labels("ok").inc()
+
+    async def close(self, timeout=5):
+        """Give queued embeds a chance to go out before shutdown"""
+        self._closing = True
+        tasks = [queue.task for queue in self._queues.values() if queue.task is not None]
+        for queue in self._queues.values():
+            queue.full.set()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
@@ -1,7 +1,28 @@
 import discord
 from discord.ext import commands
-import json
+import asyncio
+import collections
+import datetime
 import os
+import re
+import tempfile
+import time
+
+import metrics
+from attachment_mirror import MIRROR_ENABLED, AttachmentMirror
+from log_relay import LogRelay
+from member_cache import LOW_MEMORY, WatchedMemberCache, low_memory_options, memory_report
+from message_archive import ARCHIVE_ENABLED, MessageArchive
+from message_buffer import MessageRecord, RecentMessageBuffer
+from rest_scheduler import INTERACTIVE, LANE_NAMES, RestScheduler
+from shards import parse_shard_ids
+from storage import WatchlistLoadError, open_store
+from tracked_channels import TrackedChannelCache
+from user_cache import UserResolver
+from watch_rules import REGEX, WORD, JsonRuleStore, SqliteRuleStore, WatchRules
+from watchlist import Watchlist
+from watchlist_view import WatchlistPaginator
+from worker_pool import WorkerPool
 
 # Set up intents for the bot
 intents = discord.Intents.default()
@@ -10,33 +31,251 @@ intents.message_content = True
 intents.guilds = True
 intents.members = True
 
+# Sharding: SHARDED=1 runs an AutoShardedBot. SHARD_COUNT/SHARD_IDS pick the shards
+# this process runs (set by shards.py when shard ranges run in separate processes).
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = os.getenv("SHARD_IDS")
+SHARDED = os.getenv("SHARDED") == "1" or SHARD_IDS is not None
+
+class TrackerContext(commands.Context):
+    """Command context whose replies take the REST scheduler's interactive lane"""
+
+    async def send(self, *args, **kwargs):
+        return await rest_scheduler.run(INTERACTIVE, "POST", f"/channels/{self.channel.id}/messages", super().send, *args, **kwargs)
+
+class TrackerBot(commands.AutoShardedBot if SHARDED else commands.Bot):
+    """Bot that runs the monitoring workers and writes out pending watchlist changes before shutting down"""
+
+    async def setup_hook(self):
+        if METRICS_PORT:
+            await metrics_server.start()
+        monitor_pool.start()
+        if attachment_mirror:
+            attachment_mirror.start()
+        # Pick up watchlist changes made by other shard processes
+        watchlist.start_sync()
+        watch_rules.start_sync()
+        # Remove users whose monitoring period ended, including while the bot was down
+        watchlist.start_expiry(serves=lambda guild_id: self.get_guild(guild_id) is not None)
+
+    async def get_context(self, origin, *, cls=TrackerContext):
+        return await super().get_context(origin, cls=cls)
+
+    async def close(self):
+        await monitor_pool.close()
+        if attachment_mirror:
+            await attachment_mirror.close()
+        await log_relay.close()
+        await rest_scheduler.close()
+        if archive:
+            await asyncio.to_thread(archive.close)
+        await watchlist.flush()
+        watchlist_store.close()
+        watch_rules.close()
+        await metrics_server.close()
+        await super().close()
+
+bot_options = {}
+if LOW_MEMORY:
+    # Don't cache every member, WatchedMemberCache loads just the watched ones
+    bot_options.update(low_memory_options())
+if SHARDED:
+    if SHARD_COUNT:
+        bot_options["shard_count"] = int(SHARD_COUNT)
+    if SHARD_IDS:
+        bot_options["shard_ids"] = parse_shard_ids(SHARD_IDS)
+
+# Every outbound REST call waits its turn here: command replies first, then log
+# sends, then bulk user lookups
+rest_scheduler = RestScheduler()
+
+# Time every REST request (feeding rate limit headers to the scheduler), and count the library's 429 retries
+bot_options["http_trace"] = metrics.rest_trace_config(rest_scheduler.observe)
+metrics.install_rate_limit_handler()
+
 # Initialize bot with command prefix
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot = TrackerBot(command_prefix="!", intents=intents, **bot_options)
 
-# File to store monitored users data
-MONITORED_FILE = "monitored_users.json"
+# Where monitored users data lives, set WATCHLIST_BACKEND=sqlite to use watchlist.db
+# instead of monitored_users.json and its journal
+watchlist_store = open_store()
 
-# Initialize monitored users file if it doesn't exist
-if not os.path.exists(MONITORED_FILE):
-    with open(MONITORED_FILE, "w") as f:
-        json.dump({}, f)
+# Resident watchlist, loaded once at startup and shared by all handlers
+try:
+    watchlist = Watchlist.load(watchlist_store)
+except WatchlistLoadError as e:
+    # Never silently start with an empty watchlist
+    print(f"ERROR: {e}")
+    print("Refusing to start with an empty watchlist. Restore or fix the watchlist storage and try again.")
+    exit(1)
 
-def load_monitored():
-    """Load monitored users data from JSON file"""
-    try:
-        with open(MONITORED_FILE) as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        # Return empty dict if file doesn't exist or is corrupted
-        return {}
-
-def save_monitored(data):
-    """Save monitored users data to JSON file"""
+if SHARD_IDS and not watchlist_store.shared:
+    # Separate processes would overwrite each other's watchlist files
+    print("ERROR: Running a shard range in its own process needs WATCHLIST_BACKEND=sqlite.")
+    exit(1)
+
+# Users monitored in any guild (kept up to date in place by the watchlist)
+watched_users = watchlist.watched_users
+
+# Keyword and regex rules that flag messages from anyone, per guild. With a shared
+# watchlist database they live there too, so shard processes see each other's rules.
+try:
+    rules_store = SqliteRuleStore(watchlist_store.path) if watchlist_store.shared else JsonRuleStore()
+    watch_rules = WatchRules.load(rules_store)
+except WatchlistLoadError as e:
+    print(f"ERROR: {e}")
+    print("Refusing to start without the watch rules. Restore or fix the rules storage and try again.")
+    exit(1)
+
+# Guilds with at least one watch rule (kept up to date in place by watch_rules)
+rule_guilds = watch_rules.guilds
+
+# In low-memory mode only watched members stay in the member cache
+watched_members = WatchedMemberCache(bot, watchlist) if LOW_MEMORY else None
+if watched_members:
+    watchlist.add_listener(watched_members.on_watchlist_change)
+
+# Cached #tracked-users channel per guild
+tracked_channels = TrackedChannelCache(rest_scheduler)
+
+# Batches monitored message embeds into as few log channel sends as possible
+log_relay = LogRelay(tracked_channels.get, scheduler=rest_scheduler)
+
+# Shared user lookups: gateway cache first, then cached or rate-limited REST fetches
+user_resolver = UserResolver(bot, scheduler=rest_scheduler)
+
+# Recent monitored messages, so edits and deletes can be logged with the original content
+message_buffer = RecentMessageBuffer()
+
+# message_id -> edited_at of the last edit logged, for messages in neither the
+# message cache nor the buffer (most rule matches), so unfurls and pins of an
+# already logged edit aren't logged again
+logged_edits = collections.OrderedDict()
+LOGGED_EDITS_MAX = 10000
+
+# Searchable local copy of every logged monitored message (ARCHIVE_ENABLED=0 turns it off)
+archive = MessageArchive() if ARCHIVE_ENABLED else None
+
+# Local copies of monitored users' attachments, which outlive the CDN links (MIRROR_ATTACHMENTS=1)
+attachment_mirror = AttachmentMirror() if MIRROR_ENABLED else None
+
+# Workers that log monitored messages, so on_message can go straight to commands
+MONITOR_WORKERS = int(os.getenv("MONITOR_WORKERS", "4"))
+MONITOR_QUEUE_SIZE = int(os.getenv("MONITOR_QUEUE_SIZE", "1000"))
+monitor_pool = WorkerPool("monitoring", MONITOR_WORKERS, MONITOR_QUEUE_SIZE)
+
+# Instrumentation, scraped from /metrics on METRICS_HOST:METRICS_PORT and summarized by !stats
+METRICS_PORT = metrics.METRICS_PORT
+metrics_server = metrics.MetricsServer()
+# Children are looked up once, on_message runs for every message the bot sees
+MESSAGES = metrics.counter("tracker_messages_total", "Messages seen by on_message, by outcome of the watchlist check", ["result"])
+BOT_MESSAGES = MESSAGES.labels("bot")
+DIRECT_MESSAGES = MESSAGES.labels("direct")
+UNWATCHED_MESSAGES = MESSAGES.labels("unwatched")
+OTHER_GUILD_MESSAGES = MESSAGES.labels("watched_elsewhere")
+MONITORED_MESSAGES = MESSAGES.labels("monitored")
+ON_MESSAGE_SECONDS = metrics.histogram("tracker_on_message_seconds", "on_message time before command processing, for messages past the fast reject").labels()
+# The fast reject is a single set lookup, only the per-guild check behind it is timed
+WATCHLIST_LOOKUP_SECONDS = metrics.histogram("tracker_watchlist_lookup_seconds", "Per-guild watchlist check for authors watched somewhere").labels()
+# Only guilds with watch rules pay for the rule check
+RULE_CHECK_SECONDS = metrics.histogram("tracker_watch_rule_check_seconds", "Watch rule check per message in guilds with rules").labels()
+RULE_MATCHED_MESSAGES = metrics.counter("tracker_watch_rule_matches_total", "Messages flagged by at least one watch rule").labels()
+COMMANDS = metrics.counter("tracker_commands_total", "Commands run, by command and result", ["command", "result"])
+metrics.gauge("tracker_watched_users", "Users monitored in at least one guild", lambda: len(watched_users))
+metrics.gauge("tracker_guilds", "Guilds the bot is in", lambda: len(bot.guilds))
+metrics.gauge("tracker_watch_rule_guilds", "Guilds with at least one watch rule", lambda: len(rule_guilds))
+metrics.gauge("tracker_monitor_queue_depth", "Monitored messages waiting for a worker", lambda: monitor_pool.stats()["queued"])
+metrics.gauge("tracker_monitor_busy_workers", "Monitoring workers currently busy", lambda: monitor_pool.stats()["busy"])
+metrics.gauge("tracker_log_queue_depth", "Log embeds waiting to be sent", log_relay.queued)
+metrics.gauge("tracker_message_buffer_bytes", "Approximate size of the recent message buffer", lambda: message_buffer.bytes)
+metrics.gauge(
+    "tracker_rest_queue_depth", "REST requests waiting in the outbound scheduler, by lane",
+    lambda: {(name,): rest_scheduler.queued(lane) for lane, name in enumerate(LANE_NAMES)}, ["lane"]
+)
+if attachment_mirror:
+    metrics.gauge("tracker_attachment_mirror_bytes", "Disk space used by mirrored attachments", lambda: attachment_mirror.used_bytes)
+if archive:
+    metrics.gauge("tracker_archive_queue_depth", "Messages waiting for the archive writer", archive.queued)
+
+# Largest attachment !monitor_bulk / !unmonitor_bulk will read
+BULK_ATTACHMENT_MAX_BYTES = 1024 * 1024
+
+# Monitoring durations, e.g. "7d", "12h" or "1w2d", and the longest one allowed
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+MAX_MONITOR_DURATION = 365 * 86400
+
+def parse_duration(duration):
+    """Return a duration like "7d" or "1d12h" in seconds, None if it isn't valid"""
+    parts = re.findall(r"(\d+)([smhdw])", duration.lower())
+    if not parts or "".join(number + unit for number, unit in parts) != duration.lower():
+        return None
+    seconds = sum(int(number) * DURATION_UNITS[unit] for number, unit in parts)
+    if seconds <= 0 or seconds > MAX_MONITOR_DURATION:
+        return None
+    return seconds
+
+async def send_invalid_duration(ctx, duration):
+    embed = discord.Embed(
+        title="❌ Invalid Duration",
+        description=f"`{truncate(duration, 50)}` is not a valid duration. Use a number and a unit, e.g. `30m`, `12h`, `7d` or `1w2d` (up to 365 days).",
+        color=discord.Color.red()
+    )
+    await ctx.send(embed=embed)
+
+def format_expiry(expires_at):
+    """Embed text for when monitoring ends"""
+    when = datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc)
+    return f"{discord.utils.format_dt(when, 'f')} ({discord.utils.format_dt(when, 'R')})"
+
+def parse_user_id(user_id):
+    """Return a Discord user ID (snowflake) as an int, None if it isn't valid"""
     try:
-        with open(MONITORED_FILE, "w") as f:
-            json.dump(data, f, indent=4)
-    except Exception as e:
-        print(f"Error saving monitored users data: {e}")
+        user_id_int = int(user_id)
+    except ValueError:
+        return None
+    if user_id_int <= 0 or len(user_id) < 17 or len(user_id) > 20:
+        return None
+    return user_id_int
+
+async def collect_bulk_ids(ctx, ids):
+    """Parse IDs given inline or in attached text/CSV files, returns (valid IDs, invalid entries)"""
+    text = [ids]
+    for attachment in ctx.message.attachments:
+        if attachment.size > BULK_ATTACHMENT_MAX_BYTES:
+            raise ValueError(f"{attachment.filename} is larger than {BULK_ATTACHMENT_MAX_BYTES // 1024} KB")
+        text.append((await attachment.read()).decode("utf-8", errors="replace"))
+    
+    valid = []
+    invalid = []
+    seen = set()
+    for token in re.split(r"[\s,;]+", "\n".join(text)):
+        # Accept mentions as well as bare IDs
+        token = token.strip("<@!>\"'")
+        if not token or token.lower() == "user_id":
+            continue
+        user_id = parse_user_id(token)
+        if user_id is None:
+            invalid.append(token)
+        elif user_id not in seen:
+            seen.add(user_id)
+            valid.append(user_id)
+    return valid, invalid
+
+def bulk_summary_embed(title, changed_label, changed, unchanged_label, unchanged, invalid):
+    """Build the single reply for a bulk watchlist change"""
+    embed = discord.Embed(
+        title=title,
+        color=discord.Color.green() if changed else discord.Color.orange()
+    )
+    embed.add_field(name=changed_label, value=changed, inline=True)
+    embed.add_field(name=unchanged_label, value=unchanged, inline=True)
+    embed.add_field(name="Invalid IDs", value=len(invalid), inline=True)
+    if invalid:
+        shown = ", ".join(f"`{token[:25]}`" for token in invalid[:10])
+        if len(invalid) > 10:
+            shown += f" and {len(invalid) - 10} more"
+        embed.add_field(name="Skipped", value=shown, inline=False)
+    return embed
 
 @bot.event
 async def on_ready():
@@ -52,26 +291,33 @@ async def on_ready():
         name="Moderation Assistant"
     ))
     
-    print(f"[DEBUG] Connected as {bot.user} | Session ID: {bot.ws.session_id}")
+    if SHARDED:
+        print(f"[DEBUG] Connected as {bot.user} | Shards: {sorted(bot.shards)} of {bot.shard_count}")
+    else:
+        print(f"[DEBUG] Connected as {bot.user} | Session ID: {bot.ws.session_id}")
+    
+    if watched_members:
+        await watched_members.load_all()
+    report = memory_report(bot)
+    print(f"[DEBUG] Memory: {report['rss'] / 2**20:.1f} MiB RSS | {report['rss_per_guild'] / 2**10:.1f} KiB per guild | "
+          f"{report['cached_members']} cached members across {report['guilds']} guilds")
 
 
 @bot.command()
 @commands.has_permissions(manage_messages=True)
-async def monitor(ctx, user: discord.User):
-    """Command to start monitoring a user's messages"""
+async def monitor(ctx, user: discord.User, duration: str = None):
+    """Command to start monitoring a user's messages, optionally for a limited time"""
     try:
-        data = load_monitored()
-        guild_id = str(ctx.guild.id)
-        
-        # Initialize guild data if not exists
-        if guild_id not in data:
-            data[guild_id] = []
+        expires_at = None
+        if duration is not None:
+            seconds = parse_duration(duration)
+            if seconds is None:
+                await send_invalid_duration(ctx, duration)
+                return
+            expires_at = int(time.time()) + seconds
         
         # Add user to monitored list if not already monitored
-        if str(user.id) not in data[guild_id]:
-            data[guild_id].append(str(user.id))
-            save_monitored(data)
-            
+        if watchlist.add(ctx.guild.id, user.id, by=ctx.author.id, expires_at=expires_at):
             # Create embed for success message
             embed = discord.Embed(
                 title="✅ User Monitoring Started",
@@ -81,7 +327,25 @@ async def monitor(ctx, user: discord.User):
             embed.set_thumbnail(url=user.avatar.url if user.avatar else user.default_avatar.url)
             embed.add_field(name="User ID", value=user.id, inline=True)
             embed.add_field(name="Added by", value=ctx.author.mention, inline=True)
+            if expires_at:
+                embed.add_field(name="Monitoring Ends", value=format_expiry(expires_at), inline=False)
             
+            await ctx.send(embed=embed)
+        elif expires_at and watchlist.set_expiry(ctx.guild.id, user.id, expires_at, by=ctx.author.id):
+            # Already monitored, a new duration replaces the old end
+            embed = discord.Embed(
+                title="⏱️ Monitoring Period Updated",
+                description=f"{user.mention} is now monitored until {format_expiry(expires_at)}.",
+                color=discord.Color.green()
+            )
+            await ctx.send(embed=embed)
+        elif expires_at is None and watchlist.set_expiry(ctx.guild.id, user.id, None, by=ctx.author.id):
+            # Already monitored for a limited time, no duration makes it permanent
+            embed = discord.Embed(
+                title="⏱️ Monitoring Period Removed",
+                description=f"{user.mention} is now monitored with no end date.",
+                color=discord.Color.green()
+            )
             await ctx.send(embed=embed)
         else:
             # User already monitored
@@ -102,15 +366,12 @@ async def monitor(ctx, user: discord.User):
 
 @bot.command()
 @commands.has_permissions(manage_messages=True)
-async def monitor_id(ctx, user_id: str):
-    """Command to start monitoring a user by their Discord ID"""
+async def monitor_id(ctx, user_id: str, duration: str = None):
+    """Command to start monitoring a user by their Discord ID, optionally for a limited time"""
     try:
         # Validate that the input is a valid Discord ID (snowflake)
-        try:
-            user_id_int = int(user_id)
-            if user_id_int <= 0 or len(user_id) < 17 or len(user_id) > 20:
-                raise ValueError("Invalid Discord ID format")
-        except ValueError:
+        user_id_int = parse_user_id(user_id)
+        if user_id_int is None:
             embed = discord.Embed(
                 title="❌ Invalid User ID",
                 description="Please provide a valid Discord user ID (17-20 digit number).",
@@ -119,25 +380,23 @@ async def monitor_id(ctx, user_id: str):
             await ctx.send(embed=embed)
             return
         
-        data = load_monitored()
-        guild_id = str(ctx.guild.id)
-        
-        # Initialize guild data if not exists
-        if guild_id not in data:
-            data[guild_id] = []
+        expires_at = None
+        if duration is not None:
+            seconds = parse_duration(duration)
+            if seconds is None:
+                await send_invalid_duration(ctx, duration)
+                return
+            expires_at = int(time.time()) + seconds
         
         # Add user to monitored list if not already monitored
-        if user_id not in data[guild_id]:
-            data[guild_id].append(user_id)
-            save_monitored(data)
-            
+        if watchlist.add(ctx.guild.id, user_id_int, by=ctx.author.id, expires_at=expires_at):
             # Try to fetch user information for the embed
-            try:
-                user = await bot.fetch_user(user_id_int)
+            user = await user_resolver.resolve(user_id_int, ctx.guild)
+            if user:
                 user_display = f"{user.name}#{user.discriminator}" if user.discriminator != "0" else user.name
                 user_mention = user.mention
                 user_avatar = user.avatar.url if user.avatar else user.default_avatar.url
-            except:
+            else:
                 # User not found or can't be fetched
                 user_display = f"User ID: {user_id}"
                 user_mention = f"<@{user_id}>"
@@ -154,7 +413,25 @@ async def monitor_id(ctx, user_id: str):
             embed.add_field(name="User ID", value=user_id, inline=True)
             embed.add_field(name="User", value=user_display, inline=True)
             embed.add_field(name="Added by", value=ctx.author.mention, inline=True)
+            if expires_at:
+                embed.add_field(name="Monitoring Ends", value=format_expiry(expires_at), inline=False)
             
+            await ctx.send(embed=embed)
+        elif expires_at and watchlist.set_expiry(ctx.guild.id, user_id_int, expires_at, by=ctx.author.id):
+            # Already monitored, a new duration replaces the old end
+            embed = discord.Embed(
+                title="⏱️ Monitoring Period Updated",
+                description=f"<@{user_id}> is now monitored until {format_expiry(expires_at)}.",
+                color=discord.Color.green()
+            )
+            await ctx.send(embed=embed)
+        elif expires_at is None and watchlist.set_expiry(ctx.guild.id, user_id_int, None, by=ctx.author.id):
+            # Already monitored for a limited time, no duration makes it permanent
+            embed = discord.Embed(
+                title="⏱️ Monitoring Period Removed",
+                description=f"<@{user_id}> is now monitored with no end date.",
+                color=discord.Color.green()
+            )
             await ctx.send(embed=embed)
         else:
             # User already monitored
@@ -178,14 +455,8 @@ async def monitor_id(ctx, user_id: str):
 async def unmonitor(ctx, user: discord.User):
     """Command to stop monitoring a user's messages"""
     try:
-        data = load_monitored()
-        guild_id = str(ctx.guild.id)
-        
         # Check if user is monitored and remove them
-        if guild_id in data and str(user.id) in data[guild_id]:
-            data[guild_id].remove(str(user.id))
-            save_monitored(data)
-            
+        if watchlist.remove(ctx.guild.id, user.id, by=ctx.author.id):
             # Create embed for success message
             embed = discord.Embed(
                 title="✅ User Monitoring Stopped",
@@ -220,11 +491,8 @@ async def unmonitor_id(ctx, user_id: str):
     """Command to stop monitoring a user by their Discord ID"""
     try:
         # Validate that the input is a valid Discord ID
-        try:
-            user_id_int = int(user_id)
-            if user_id_int <= 0 or len(user_id) < 17 or len(user_id) > 20:
-                raise ValueError("Invalid Discord ID format")
-        except ValueError:
+        user_id_int = parse_user_id(user_id)
+        if user_id_int is None:
             embed = discord.Embed(
                 title="❌ Invalid User ID",
                 description="Please provide a valid Discord user ID (17-20 digit number).",
@@ -233,21 +501,15 @@ async def unmonitor_id(ctx, user_id: str):
             await ctx.send(embed=embed)
             return
         
-        data = load_monitored()
-        guild_id = str(ctx.guild.id)
-        
         # Check if user is monitored and remove them
-        if guild_id in data and user_id in data[guild_id]:
-            data[guild_id].remove(user_id)
-            save_monitored(data)
-            
+        if watchlist.remove(ctx.guild.id, user_id_int, by=ctx.author.id):
             # Try to fetch user information for the embed
-            try:
-                user = await bot.fetch_user(user_id_int)
+            user = await user_resolver.resolve(user_id_int, ctx.guild)
+            if user:
                 user_display = f"{user.name}#{user.discriminator}" if user.discriminator != "0" else user.name
                 user_mention = user.mention
                 user_avatar = user.avatar.url if user.avatar else user.default_avatar.url
-            except:
+            else:
                 # User not found or can't be fetched
                 user_display = f"User ID: {user_id}"
                 user_mention = f"<@{user_id}>"
@@ -288,10 +550,9 @@ async def unmonitor_id(ctx, user_id: str):
 async def monitored(ctx):
     """Command to list all monitored users in the guild"""
     try:
-        data = load_monitored()
-        guild_id = str(ctx.guild.id)
+        user_ids = watchlist.members(ctx.guild.id)
         
-        if guild_id not in data or not data[guild_id]:
+        if not user_ids:
             embed = discord.Embed(
                 title="📋 Monitored Users",
                 description="No users are currently being monitored in this server.",
@@ -300,33 +561,440 @@ async def monitored(ctx):
             await ctx.send(embed=embed)
             return
         
-        # Get user objects for monitored user IDs
-        monitored_users = []
-        for user_id in data[guild_id]:
-            try:
-                user = await bot.fetch_user(int(user_id))
-                monitored_users.append(f"{user.mention} (`{user.id}`)")
-            except:
-                # User not found, remove from list
-                monitored_users.append(f"Unknown User (`{user_id}`)")
+        # Only the visible page is resolved, later pages load as the buttons are used
+        view = WatchlistPaginator(ctx.author.id, ctx.guild, user_ids, user_resolver, watchlist.guild_expiries(ctx.guild.id))
+        embed = await view.render()
+        
+        if view.pages == 1:
+            await ctx.send(embed=embed)
+        else:
+            view.message = await ctx.send(embed=embed, view=view)
+        
+    except Exception as e:
+        error_embed = discord.Embed(
+            title="❌ Error",
+            description=f"Failed to list monitored users: {str(e)}",
+            color=discord.Color.red()
+        )
+        await ctx.send(embed=error_embed)
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def monitor_bulk(ctx, *, ids: str = ""):
+    """Command to start monitoring many users at once by ID (inline or attached file)"""
+    try:
+        user_ids, invalid = await collect_bulk_ids(ctx, ids)
+        
+        if not user_ids and not invalid:
+            embed = discord.Embed(
+                title="❌ No User IDs",
+                description="Provide user IDs after the command or attach a .txt/.csv file of IDs.",
+                color=discord.Color.red()
+            )
+            await ctx.send(embed=embed)
+            return
+        
+        # One batched change, written out in a single persistence write
+        added = watchlist.add_many(ctx.guild.id, user_ids, by=ctx.author.id)
+        
+        embed = bulk_summary_embed(
+            "✅ Bulk Monitoring Started", 
+            "Added", len(added), 
+            "Already Monitored", len(user_ids) - len(added), 
+            invalid
+        )
+        embed.add_field(name="Added by", value=ctx.author.mention, inline=True)
+        await ctx.send(embed=embed)
+        
+    except Exception as e:
+        error_embed = discord.Embed(
+            title="❌ Error",
+            description=f"Failed to monitor users: {str(e)}",
+            color=discord.Color.red()
+        )
+        await ctx.send(embed=error_embed)
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def unmonitor_bulk(ctx, *, ids: str = ""):
+    """Command to stop monitoring many users at once by ID (inline or attached file)"""
+    try:
+        user_ids, invalid = await collect_bulk_ids(ctx, ids)
+        
+        if not user_ids and not invalid:
+            embed = discord.Embed(
+                title="❌ No User IDs",
+                description="Provide user IDs after the command or attach a .txt/.csv file of IDs.",
+                color=discord.Color.red()
+            )
+            await ctx.send(embed=embed)
+            return
+        
+        # One batched change, written out in a single persistence write
+        removed = watchlist.remove_many(ctx.guild.id, user_ids, by=ctx.author.id)
+        
+        embed = bulk_summary_embed(
+            "✅ Bulk Monitoring Stopped", 
+            "Removed", len(removed), 
+            "Not Monitored", len(user_ids) - len(removed), 
+            invalid
+        )
+        embed.add_field(name="Removed by", value=ctx.author.mention, inline=True)
+        await ctx.send(embed=embed)
+        
+    except Exception as e:
+        error_embed = discord.Embed(
+            title="❌ Error",
+            description=f"Failed to unmonitor users: {str(e)}",
+            color=discord.Color.red()
+        )
+        await ctx.send(embed=error_embed)
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def watchlist_export(ctx):
+    """Command to export the guild's watchlist as a CSV attachment"""
+    try:
+        user_ids = watchlist.members(ctx.guild.id)
+        
+        # Written line by line, spills to disk if the list is large
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as f:
+            f.write(b"user_id\n")
+            for user_id in user_ids:
+                f.write(b"%d\n" % user_id)
+            f.seek(0)
+            
+            embed = discord.Embed(
+                title="📤 Watchlist Export",
+                description=f"{len(user_ids)} monitored user(s) in this server.",
+                color=discord.Color.blue()
+            )
+            await ctx.send(embed=embed, file=discord.File(f, filename=f"watchlist-{ctx.guild.id}.csv"))
+        
+    except Exception as e:
+        error_embed = discord.Embed(
+            title="❌ Error",
+            description=f"Failed to export the watchlist: {str(e)}",
+            color=discord.Color.red()
+        )
+        await ctx.send(embed=error_embed)
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def history(ctx, user_id: str):
+    """Command to show who started or stopped monitoring a user"""
+    try:
+        # Validate that the input is a valid Discord ID (snowflake)
+        user_id_int = parse_user_id(user_id)
+        if user_id_int is None:
+            embed = discord.Embed(
+                title="❌ Invalid User ID",
+                description="Please provide a valid Discord user ID (17-20 digit number).",
+                color=discord.Color.red()
+            )
+            await ctx.send(embed=embed)
+            return
+        
+        events = await watchlist.history(ctx.guild.id, user_id_int)
+        
+        if not events:
+            embed = discord.Embed(
+                title="📜 Watchlist History",
+                description=f"No watchlist changes recorded for <@{user_id}>.",
+                color=discord.Color.blue()
+            )
+            await ctx.send(embed=embed)
+            return
+        
+        lines = []
+        for event in events:
+            when = discord.utils.format_dt(datetime.datetime.fromtimestamp(event["ts"], datetime.timezone.utc), "f")
+            if event["op"] == "expire":
+                lines.append(f"Monitoring period ended on {when}")
+                continue
+            action = "Added" if event["op"] == "add" else "Removed"
+            by = f"<@{event['by']}>" if event.get("by") else "unknown"
+            until = f" until {format_expiry(event['exp'])}" if event.get("exp") else ""
+            lines.append(f"{action} by {by} on {when}{until}")
         
         embed = discord.Embed(
-            title="📋 Monitored Users",
-            description="\n".join(monitored_users),
+            title="📜 Watchlist History",
+            description=f"<@{user_id}>\n" + "\n".join(lines),
             color=discord.Color.blue()
         )
-        embed.add_field(name="Total Count", value=len(monitored_users), inline=True)
+        await ctx.send(embed=embed)
         
+    except Exception as e:
+        error_embed = discord.Embed(
+            title="❌ Error",
+            description=f"Failed to load watchlist history: {str(e)}",
+            color=discord.Color.red()
+        )
+        await ctx.send(embed=error_embed)
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def search(ctx, *, query: str):
+    """Command to search archived monitored messages in this server"""
+    if not archive:
+        embed = discord.Embed(
+            title="❌ Archive Disabled",
+            description="The message archive is turned off (ARCHIVE_ENABLED=0).",
+            color=discord.Color.red()
+        )
+        await ctx.send(embed=embed)
+        return
+    
+    try:
+        # SQLite runs in a thread so a slow query never stalls the event loop
+        results = await asyncio.to_thread(archive.search, ctx.guild.id, query)
+        
+        if not results:
+            embed = discord.Embed(
+                title="🔎 Search Results",
+                description=f"No archived messages match `{truncate(query, 200)}`.",
+                color=discord.Color.blue()
+            )
+            await ctx.send(embed=embed)
+            return
+        
+        embed = discord.Embed(
+            title="🔎 Search Results",
+            description=f"Best matches for `{truncate(query, 200)}`",
+            color=discord.Color.blue()
+        )
+        for result in results:
+            when = discord.utils.format_dt(datetime.datetime.fromtimestamp(result["created_at"], datetime.timezone.utc), "f")
+            jump_url = f"https://discord.com/channels/{ctx.guild.id}/{result['channel_id']}/{result['message_id']}"
+            embed.add_field(
+                name=truncate(f"{result['author_name']} ({result['author_id']})", 256),
+                value=truncate(f"{result['snippet'] or '*No text content*'}\n<#{result['channel_id']}> · {when} · [Jump]({jump_url})", 1024),
+                inline=False
+            )
         await ctx.send(embed=embed)
         
     except Exception as e:
         error_embed = discord.Embed(
             title="❌ Error",
-            description=f"Failed to list monitored users: {str(e)}",
+            description=f"Failed to search the message archive: {str(e)}",
+            color=discord.Color.red()
+        )
+        await ctx.send(embed=error_embed)
+
+def format_watch_rules(rules):
+    """One line per rule, e.g. #3 word: `free nitro`"""
+    return "\n".join(f"#{rule['id']} {rule['kind']}: `{truncate(rule['pattern'], 100)}`" for rule in rules)
+
+async def add_watch_rule(ctx, kind, pattern):
+    """Add a watch rule for this server and save the rules"""
+    try:
+        rule = await watch_rules.add(ctx.guild.id, kind, pattern, by=ctx.author.id)
+        embed = discord.Embed(
+            title="🚩 Watch Rule Added",
+            description=f"Messages matching {format_watch_rules([rule])} will be logged to #tracked-users.",
+            color=discord.Color.green()
+        )
+        embed.add_field(name="Rule ID", value=rule["id"], inline=True)
+        embed.add_field(name="Added by", value=ctx.author.mention, inline=True)
+        await ctx.send(embed=embed)
+        
+    except ValueError as e:
+        embed = discord.Embed(
+            title="❌ Invalid Watch Rule",
+            description=str(e),
+            color=discord.Color.red()
+        )
+        await ctx.send(embed=embed)
+        
+    except Exception as e:
+        error_embed = discord.Embed(
+            title="❌ Error",
+            description=f"Failed to add watch rule: {str(e)}",
+            color=discord.Color.red()
+        )
+        await ctx.send(embed=error_embed)
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def watch_word(ctx, *, text: str):
+    """Command to flag messages from anyone that contain some text"""
+    await add_watch_rule(ctx, WORD, text)
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def watch_regex(ctx, *, pattern: str):
+    """Command to flag messages from anyone that match a regular expression"""
+    await add_watch_rule(ctx, REGEX, pattern)
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def unwatch_rule(ctx, rule_id: int):
+    """Command to remove a watch rule by its ID"""
+    try:
+        rule = await watch_rules.remove(ctx.guild.id, rule_id)
+        if rule is None:
+            embed = discord.Embed(
+                title="⚠️ No Such Rule",
+                description=f"This server has no watch rule #{rule_id}. Use `!watch_rules` to list them.",
+                color=discord.Color.orange()
+            )
+            await ctx.send(embed=embed)
+            return
+        
+        embed = discord.Embed(
+            title="✅ Watch Rule Removed",
+            description=format_watch_rules([rule]),
+            color=discord.Color.green()
+        )
+        await ctx.send(embed=embed)
+        
+    except Exception as e:
+        error_embed = discord.Embed(
+            title="❌ Error",
+            description=f"Failed to remove watch rule: {str(e)}",
             color=discord.Color.red()
         )
         await ctx.send(embed=error_embed)
 
+@bot.command(name='watch_rules')
+@commands.has_permissions(manage_messages=True)
+async def watch_rules_list(ctx):
+    """Command to show this server's watch rules"""
+    rules = watch_rules.rules(ctx.guild.id)
+    if not rules:
+        embed = discord.Embed(
+            title="🚩 Watch Rules",
+            description="No watch rules are set up in this server.",
+            color=discord.Color.blue()
+        )
+        await ctx.send(embed=embed)
+        return
+    
+    embed = discord.Embed(
+        title="🚩 Watch Rules",
+        description=truncate(format_watch_rules(rules), 4096),
+        color=discord.Color.blue()
+    )
+    embed.set_footer(text=f"{len(rules)} rules · remove one with !unwatch_rule <id>")
+    await ctx.send(embed=embed)
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def pipeline(ctx):
+    """Command to show the state of the monitoring pipeline"""
+    stats = monitor_pool.stats()
+    
+    embed = discord.Embed(
+        title="⚙️ Monitoring Pipeline",
+        color=discord.Color.blue()
+    )
+    embed.add_field(name="Queue Depth", value=f"{stats['queued']} / {stats['max_queued']}", inline=True)
+    embed.add_field(name="Busy Workers", value=f"{stats['busy']} / {stats['workers']}", inline=True)
+    embed.add_field(name="Worker Utilization", value=f"{stats['utilization']:.1%}", inline=True)
+    embed.add_field(name="Processed", value=stats["processed"], inline=True)
+    embed.add_field(name="Failed", value=stats["failed"], inline=True)
+    embed.add_field(name="Dropped", value=stats["dropped"], inline=True)
+    embed.add_field(name="Log Embeds Queued", value=log_relay.queued(), inline=True)
+    embed.add_field(name="Log Embeds Sent", value=log_relay.sent_embeds, inline=True)
+    embed.add_field(name="Log Embeds Dropped", value=log_relay.dropped_embeds, inline=True)
+    embed.add_field(
+        name="Message Buffer", 
+        value=f"{len(message_buffer)} messages, {message_buffer.bytes / 2**20:.1f} / {message_buffer.max_bytes / 2**20:.0f} MiB", 
+        inline=True
+    )
+    embed.add_field(
+        name="REST Lanes",
+        value="\n".join(
+            f"{name}: {lane['queued']} queued, {lane['dispatched']} sent, {lane['dropped']} shed"
+            for name, lane in rest_scheduler.stats().items()
+        ),
+        inline=False
+    )
+    if attachment_mirror:
+        mirror_stats = attachment_mirror.stats()
+        embed.add_field(
+            name="Attachment Mirror",
+            value=(
+                f"{mirror_stats['queued']} queued, {mirror_stats['stored']} stored, {mirror_stats['duplicates']} duplicates, "
+                f"{mirror_stats['skipped']} skipped, {mirror_stats['failed']} failed\n"
+                f"{mirror_stats['used_bytes'] / 2**20:.1f} / {mirror_stats['quota_bytes'] / 2**20:.0f} MiB used"
+            ),
+            inline=False
+        )
+    if archive:
+        embed.add_field(name="Archive Queued", value=archive.queued(), inline=True)
+        embed.add_field(name="Archived", value=archive.archived, inline=True)
+        embed.add_field(name="Archive Dropped", value=archive.dropped, inline=True)
+    
+    await ctx.send(embed=embed)
+
+@bot.command()
+@commands.has_permissions(manage_messages=True)
+async def memory(ctx):
+    """Command to show the bot's memory footprint"""
+    report = memory_report(bot)
+    
+    embed = discord.Embed(
+        title="🧠 Memory Usage",
+        description="Low-memory mode: only watched members are cached." if LOW_MEMORY else "Full member cache.",
+        color=discord.Color.blue()
+    )
+    embed.add_field(name="RSS", value=f"{report['rss'] / 2**20:.1f} MiB", inline=True)
+    embed.add_field(name="Guilds", value=report["guilds"], inline=True)
+    embed.add_field(name="RSS per Guild", value=f"{report['rss_per_guild'] / 2**10:.1f} KiB", inline=True)
+    embed.add_field(name="Cached Members", value=report["cached_members"], inline=True)
+    embed.add_field(name="Cached Users", value=report["cached_users"], inline=True)
+    
+    await ctx.send(embed=embed)
+
+def metric_name(metric, values):
+    """Short display name for a metric sample, e.g. log_sends{ok}"""
+    name = metric.name.removeprefix("tracker_").removesuffix("_total").removesuffix("_seconds")
+    return f"{name}{{{','.join(values)}}}" if values else name
+
+def format_seconds(seconds):
+    if seconds == float("inf"):
+        return "> 30 s"
+    if seconds < 0.001:
+        return f"{seconds * 1e6:.1f} µs"
+    return f"{seconds * 1000:.1f} ms" if seconds < 1 else f"{seconds:.2f} s"
+
+@bot.command()
+@commands.has_permissions(administrator=True)
+async def stats(ctx):
+    """Command to show counters and latency histograms for the bot's hot paths"""
+    latencies = []
+    counters = []
+    gauges = []
+    for metric in metrics.REGISTRY.metrics():
+        if isinstance(metric, metrics.Histogram):
+            for values, child in metric.items():
+                if child.count:
+                    latencies.append(
+                        f"{metric_name(metric, values)}: {child.count:,} × avg {format_seconds(child.sum / child.count)}, "
+                        f"p50 ≤ {format_seconds(child.quantile(0.5))}, p99 ≤ {format_seconds(child.quantile(0.99))}"
+                    )
+        elif isinstance(metric, metrics.Counter):
+            for values, child in metric.items():
+                counters.append(f"{metric_name(metric, values)}: {child.value:,}")
+        else:
+            try:
+                for values, value in metric.items():
+                    gauges.append(f"{metric_name(metric, values)}: {value:,}")
+            except Exception as e:
+                gauges.append(f"{metric_name(metric, ())}: error ({e})")
+    
+    embed = discord.Embed(
+        title="📈 Bot Statistics",
+        description=f"Prometheus metrics: `http://{metrics_server.host}:{metrics_server.port}/metrics`" if METRICS_PORT else "Metrics endpoint disabled (METRICS_PORT=0).",
+        color=discord.Color.blue()
+    )
+    embed.add_field(name="⏱️ Latency", value=truncate("\n".join(latencies) or "No samples yet", 1024), inline=False)
+    embed.add_field(name="🔢 Counters", value=truncate("\n".join(counters) or "No samples yet", 1024), inline=False)
+    embed.add_field(name="📊 Current", value=truncate("\n".join(gauges), 1024), inline=False)
+    
+    await ctx.send(embed=embed)
+
 @bot.command(name='commands')
 @commands.has_permissions(manage_messages=True)
 async def commands_help(ctx):
@@ -339,13 +1007,13 @@ async def commands_help(ctx):
     
     embed.add_field(
         name="👁️ Monitor by Mention", 
-        value="`!monitor @user` - Start monitoring a user by mentioning them",
+        value="`!monitor @user [duration]` - Start monitoring a user by mentioning them, optionally for a time like `7d` (without one, an existing time limit is removed)",
         inline=False
     )
     
     embed.add_field(
         name="🆔 Monitor by ID", 
-        value="`!monitor_id <user_id>` - Start monitoring a user by their Discord ID",
+        value="`!monitor_id <user_id> [duration]` - Start monitoring a user by their Discord ID, optionally for a time like `12h`",
         inline=False
     )
     
@@ -361,12 +1029,67 @@ async def commands_help(ctx):
         inline=False
     )
     
+    embed.add_field(
+        name="📥 Bulk Monitor", 
+        value="`!monitor_bulk <ids...>` - Start monitoring many IDs at once (or attach a .txt/.csv file)",
+        inline=False
+    )
+    
+    embed.add_field(
+        name="📤 Bulk Unmonitor", 
+        value="`!unmonitor_bulk <ids...>` - Stop monitoring many IDs at once (or attach a .txt/.csv file)",
+        inline=False
+    )
+    
     embed.add_field(
         name="📋 View Watchlist", 
         value="`!monitored` - Show all currently monitored users",
         inline=False
     )
     
+    embed.add_field(
+        name="💾 Export Watchlist", 
+        value="`!watchlist_export` - Download this server's watchlist as a CSV file",
+        inline=False
+    )
+    
+    embed.add_field(
+        name="📜 Watchlist History", 
+        value="`!history <user_id>` - Show who started or stopped monitoring a user",
+        inline=False
+    )
+    
+    embed.add_field(
+        name="🔎 Search Messages", 
+        value="`!search <words>` - Search archived messages from monitored users",
+        inline=False
+    )
+    
+    embed.add_field(
+        name="🚩 Watch Rules", 
+        value="`!watch_word <text>` / `!watch_regex <pattern>` - Log messages from anyone that contain the text or match the pattern\n"
+              "`!watch_rules` - List this server's rules, `!unwatch_rule <id>` - Remove one",
+        inline=False
+    )
+    
+    embed.add_field(
+        name="⚙️ Pipeline Status", 
+        value="`!pipeline` - Show monitoring queue depth and worker utilization",
+        inline=False
+    )
+    
+    embed.add_field(
+        name="🧠 Memory Usage", 
+        value="`!memory` - Show memory use per server and member cache size",
+        inline=False
+    )
+    
+    embed.add_field(
+        name="📈 Statistics", 
+        value="`!stats` - Show message, storage, logging and REST counters and latencies (administrators only)",
+        inline=False
+    )
+    
     embed.add_field(
         name="❓ Commands", 
         value="`!commands` - Show this help message",
@@ -388,77 +1111,265 @@ async def on_message(message):
     """Event triggered when a message is sent"""
     # Ignore bot messages
     if message.author.bot:
+        BOT_MESSAGES.inc()
         return
     
     # Skip if message is not from a guild
     if not message.guild:
+        DIRECT_MESSAGES.inc()
         return
     
-    try:
-        data = load_monitored()
-        guild_id = str(message.guild.id)
-        
-        # Check if user is monitored
-        if guild_id in data and str(message.author.id) in data[guild_id]:
-            # Find or create the tracked-users channel
-            mod_log_channel = discord.utils.get(message.guild.text_channels, name="tracked-users")
-            
-            if not mod_log_channel:
-                # Try to create the channel if it doesn't exist
-                try:
-                    mod_log_channel = await message.guild.create_text_channel(
-                        name="tracked-users",
-                        topic="Logs for monitored user messages",
-                        reason="Auto-created by user tracking bot"
-                    )
-                except discord.Forbidden:
-                    print(f"Missing permissions to create tracked-users channel in {message.guild.name}")
-                    return
-            
-            if mod_log_channel:
-                # Create embed for the logged message
-                embed = discord.Embed(
-                    title="📝 Monitored Message",
-                    description=message.content or "*No text content*",
-                    color=discord.Color.red()
-                )
-                
-                # Set author information
-                embed.set_author(
-                    name=f"{message.author} ({message.author.id})", 
-                    icon_url=message.author.avatar.url if message.author.avatar else message.author.default_avatar.url
-                )
-                
-                # Add channel and timestamp information
-                embed.add_field(name="Channel", value=message.channel.mention, inline=True)
-                embed.add_field(name="Message ID", value=message.id, inline=True)
-                embed.timestamp = message.created_at
-                
-                # Add attachment information if present
-                if message.attachments:
-                    attachment_info = []
-                    for attachment in message.attachments:
-                        attachment_info.append(f"[{attachment.filename}]({attachment.url})")
-                    embed.add_field(name="Attachments", value="\n".join(attachment_info), inline=False)
-                
-                # Add jump link to original message
-                embed.add_field(name="Jump to Message", value=f"[Click here]({message.jump_url})", inline=True)
-                
-                await mod_log_channel.send(embed=embed)
-                
-    except Exception as e:
-        print(f"Error logging monitored message: {e}")
+    # Fast reject: set lookups drop authors nobody watches in guilds without watch
+    # rules before any other work (counted, not timed, to keep it allocation-free)
+    watched = message.author.id in watched_users
+    if not watched and message.guild.id not in rule_guilds:
+        UNWATCHED_MESSAGES.inc()
+        await bot.process_commands(message)
+        return
+    
+    started = time.perf_counter()
+    # The per-guild check: in-memory lookups, no file access
+    if not watched:
+        monitored = False
+        UNWATCHED_MESSAGES.inc()
+    else:
+        lookup_started = time.perf_counter()
+        monitored = watchlist.is_monitored(message.guild.id, message.author.id)
+        WATCHLIST_LOOKUP_SECONDS.observe(time.perf_counter() - lookup_started)
+        (MONITORED_MESSAGES if monitored else OTHER_GUILD_MESSAGES).inc()
+    
+    # Watch rules apply to every author, but only in guilds that have some
+    matched_rules = None
+    if message.guild.id in rule_guilds:
+        rules_started = time.perf_counter()
+        try:
+            matched_rules = watch_rules.match(message.guild.id, message.content)
+        except Exception as e:
+            # A broken rule must never keep commands from running
+            print(f"Error checking watch rules of guild {message.guild.id}: {e}")
+        RULE_CHECK_SECONDS.observe(time.perf_counter() - rules_started)
+        if matched_rules:
+            RULE_MATCHED_MESSAGES.inc()
+    
+    if monitored:
+        # Remember the content in case the message is edited or deleted later
+        message_buffer.add(MessageRecord.from_message(message))
+    if monitored or matched_rules:
+        # Logging runs on the worker pool so it never delays command handling
+        # (if the queue is full the message is dropped and counted in !pipeline)
+        monitor_pool.submit(log_monitored_message, message, matched_rules)
+    ON_MESSAGE_SECONDS.observe(time.perf_counter() - started)
     
     # Process commands
     await bot.process_commands(message)
 
+async def log_monitored_message(message, matched_rules=None):
+    """Log a monitored user's or rule-matching message to the tracked-users channel (runs on monitor_pool)"""
+    # Create embed for the logged message
+    embed = discord.Embed(
+        title="📝 Monitored Message" if watchlist.is_monitored(message.guild.id, message.author.id) else "🚩 Watch Rule Match",
+        description=message.content or "*No text content*",
+        color=discord.Color.red()
+    )
+    
+    # Set author information
+    embed.set_author(
+        name=f"{message.author} ({message.author.id})", 
+        icon_url=message.author.avatar.url if message.author.avatar else message.author.default_avatar.url
+    )
+    
+    # Add channel and timestamp information
+    embed.add_field(name="Channel", value=message.channel.mention, inline=True)
+    embed.add_field(name="Message ID", value=message.id, inline=True)
+    embed.timestamp = message.created_at
+    
+    # Add attachment information if present
+    if message.attachments:
+        attachment_info = []
+        for attachment in message.attachments:
+            attachment_info.append(f"[{attachment.filename}]({attachment.url})")
+        embed.add_field(name="Attachments", value=truncate("\n".join(attachment_info), 1024), inline=False)
+    
+    if matched_rules:
+        embed.add_field(name="Matched Rules", value=truncate(format_watch_rules(matched_rules), 1024), inline=False)
+    
+    # Add jump link to original message
+    embed.add_field(name="Jump to Message", value=f"[Click here]({message.jump_url})", inline=True)
+    
+    # Hand off to the relay, it finds the tracked-users channel and sends in batches
+    log_relay.enqueue(message.guild, embed)
+    
+    # Queue it for the archive's writer thread so !search can find it later
+    if archive:
+        archive.add(message)
+    
+    # Downloads run on the mirror's own workers
+    if attachment_mirror and message.attachments:
+        attachment_mirror.mirror(message)
+
+def truncate(text, limit):
+    """Shorten text to fit an embed field"""
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+@bot.event
+async def on_raw_message_edit(payload):
+    """Event triggered when a message is edited, even if it is no longer cached"""
+    if payload.guild_id is None:
+        return
+    
+    # MESSAGE_UPDATE carries the whole message, so link previews being added and
+    # pins arrive here too. Only a real edit moves edited_timestamp.
+    edited_at = payload.message.edited_at
+    if edited_at is None:
+        return
+    if payload.cached_message is not None and payload.cached_message.edited_at == edited_at:
+        return
+    
+    author_id = int(payload.data.get("author", {}).get("id", 0))
+    monitored = author_id in watched_users and watchlist.is_monitored(payload.guild_id, author_id)
+    # Rules ignore bots, like on_message does
+    if not monitored and (payload.guild_id not in rule_guilds or payload.data.get("author", {}).get("bot")):
+        return
+    
+    content = payload.message.content
+    
+    # Catches messages edited into something a rule flags after they were posted
+    matched_rules = watch_rules.match(payload.guild_id, content) if payload.guild_id in rule_guilds else None
+    if not monitored and not matched_rules:
+        return
+    
+    record = message_buffer.get(payload.message_id)
+    if record is not None:
+        previous = message_buffer.update_content(payload.message_id, content)
+        if previous == content:
+            return
+    elif payload.cached_message is not None:
+        # Evicted from the buffer (or a rule match) but discord.py still has the message
+        previous = payload.cached_message.content
+        if previous == content:
+            return
+    else:
+        previous = None
+        if logged_edits.get(payload.message_id) == edited_at:
+            return
+        logged_edits[payload.message_id] = edited_at
+        logged_edits.move_to_end(payload.message_id)
+        if len(logged_edits) > LOGGED_EDITS_MAX:
+            logged_edits.popitem(last=False)
+    
+    guild = bot.get_guild(payload.guild_id)
+    if guild is None:
+        return
+    
+    embed = discord.Embed(
+        title="✏️ Monitored Message Edited" if monitored else "🚩 Watch Rule Match (Edited)",
+        color=discord.Color.orange()
+    )
+    author_name = record.author_name if record else payload.data.get("author", {}).get("username", "Unknown User")
+    embed.set_author(name=f"{author_name} ({author_id})")
+    embed.add_field(
+        name="Before",
+        value=truncate(previous or "*No text content*", 1024) if previous is not None else "*Not in the recent message buffer*",
+        inline=False
+    )
+    embed.add_field(name="After", value=truncate(content or "*No text content*", 1024), inline=False)
+    if matched_rules:
+        embed.add_field(name="Matched Rules", value=truncate(format_watch_rules(matched_rules), 1024), inline=False)
+    embed.add_field(name="Channel", value=f"<#{payload.channel_id}>", inline=True)
+    embed.add_field(name="Message ID", value=payload.message_id, inline=True)
+    embed.add_field(
+        name="Jump to Message",
+        value=f"[Click here](https://discord.com/channels/{payload.guild_id}/{payload.channel_id}/{payload.message_id})",
+        inline=True
+    )
+    embed.timestamp = discord.utils.utcnow()
+    
+    log_relay.enqueue(guild, embed)
+
+@bot.event
+async def on_raw_message_delete(payload):
+    """Event triggered when a message is deleted, even if it is no longer cached"""
+    if payload.guild_id is not None:
+        log_deleted_message(payload.guild_id, payload.message_id)
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    """Event triggered when messages are purged in bulk"""
+    if payload.guild_id is not None:
+        for message_id in payload.message_ids:
+            log_deleted_message(payload.guild_id, message_id)
+
+def log_deleted_message(guild_id, message_id):
+    """Log the deletion of a buffered monitored message"""
+    # Raw delete events carry no author or content, the buffer has both
+    record = message_buffer.pop(message_id)
+    if record is None or not watchlist.is_monitored(guild_id, record.author_id):
+        return
+    
+    guild = bot.get_guild(guild_id)
+    if guild is None:
+        return
+    
+    embed = discord.Embed(
+        title="🗑️ Monitored Message Deleted",
+        description=record.content or "*No text content*",
+        color=discord.Color.dark_red()
+    )
+    embed.set_author(name=f"{record.author_name} ({record.author_id})")
+    embed.add_field(name="Channel", value=f"<#{record.channel_id}>", inline=True)
+    embed.add_field(name="Message ID", value=record.message_id, inline=True)
+    embed.add_field(name="Sent", value=discord.utils.format_dt(record.created_at, "f"), inline=True)
+    
+    if record.attachments:
+        attachment_info = [f"[{filename}]({url})" for filename, url in record.attachments]
+        embed.add_field(name="Attachments", value=truncate("\n".join(attachment_info), 1024), inline=False)
+    
+    # The CDN links stop working once the message is gone, point at the local copies
+    mirrored = attachment_mirror.lookup(message_id) if attachment_mirror else []
+    if mirrored:
+        mirrored_info = [f"{filename}: `{path}`" for filename, path in mirrored]
+        embed.add_field(name="Mirrored Copies", value=truncate("\n".join(mirrored_info), 1024), inline=False)
+    
+    embed.timestamp = discord.utils.utcnow()
+    
+    log_relay.enqueue(guild, embed)
+
+@bot.event
+async def on_guild_channel_create(channel):
+    """Event triggered when a channel is created"""
+    tracked_channels.channel_created(channel)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    """Event triggered when a channel is deleted"""
+    tracked_channels.channel_deleted(channel)
+
+@bot.event
+async def on_guild_channel_update(before, after):
+    """Event triggered when a channel is renamed or otherwise changed"""
+    tracked_channels.channel_updated(before, after)
+
+@bot.event
+async def on_command_completion(ctx):
+    """Count successful commands for !stats and /metrics"""
+    COMMANDS.labels(ctx.command.name, "ok").inc()
+
+def command_usage(command):
+    """Usage line of a command, e.g. `!unwatch_rule <rule_id>`"""
+    usage = f"!{command.qualified_name}"
+    if command.signature:
+        usage += f" {command.signature}"
+    return f"`{usage}`"
+
 @bot.event
 async def on_command_error(ctx, error):
     """Handle command errors"""
+    COMMANDS.labels(ctx.command.name if ctx.command else "unknown", type(error).__name__).inc()
     if isinstance(error, commands.MissingPermissions):
+        missing = ", ".join(permission.replace("_", " ").title() for permission in error.missing_permissions)
         embed = discord.Embed(
             title="❌ Missing Permissions",
-            description="You need the `Manage Messages` permission to use this command.",
+            description=f"You need the `{missing}` permission to use this command.",
             color=discord.Color.red()
         )
         await ctx.send(embed=embed)
@@ -472,7 +1383,14 @@ async def on_command_error(ctx, error):
     elif isinstance(error, commands.MissingRequiredArgument):
         embed = discord.Embed(
             title="❌ Missing Argument",
-            description=f"Please provide a user to {ctx.command.name}.\nUsage: `!{ctx.command.name} @user`",
+            description=f"Please provide `{error.param.name}`.\nUsage: {command_usage(ctx.command)}",
+            color=discord.Color.red()
+        )
+        await ctx.send(embed=embed)
+    elif isinstance(error, commands.BadArgument):
+        embed = discord.Embed(
+            title="❌ Invalid Argument",
+            description=f"{error}\nUsage: {command_usage(ctx.command)}",
             color=discord.Color.red()
         )
         await ctx.send(embed=embed)
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import resource
+import sys
+
+import discord
+
+# LOW_MEMORY=1 keeps only watched members (and the bot itself) in the member cache
+LOW_MEMORY = os.getenv("LOW_MEMORY") == "1"
+
+# Discord returns at most 100 members per query_members request
+QUERY_BATCH_SIZE = 100
+
+# Seconds to collect newly watched users before querying their member objects
+LOAD_DELAY = 1.0
+
+
+def low_memory_options():
+    """Bot options that stop the library from caching every member of every guild"""
+    return {
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "chunk_guilds_at_startup": False,
+    }
+
+
+def current_rss():
+    """Return the process's resident set size in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Not Linux: fall back to the peak RSS (bytes on macOS, KB elsewhere)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def memory_report(bot):
+    """Return RSS and member cache figures for capacity planning"""
+    rss = current_rss()
+    guilds = len(bot.guilds)
+    return {
+        "rss": rss,
+        "guilds": guilds,
+        "rss_per_guild": rss / guilds if guilds else rss,
+        "cached_members": sum(len(guild.members) for guild in bot.guilds),
+        "cached_users": len(bot.users),
+    }
+
+
+class WatchedMemberCache:
+    """Keeps exactly the watched members resident when the library's member cache is off
+
+    Watched members are requested over the gateway with query_members(cache=True)
+    when the bot becomes ready and whenever someone is added to the watchlist.
+    Unwatched members are dropped from the cache again. Everybody else is
+    resolved lazily through UserResolver.
+    """
+
+    def __init__(self, bot, watchlist):
+        self._bot = bot
+        self._watchlist = watchlist
+        # guild_id -> user IDs waiting to be queried
+        self._pending = {}
+        self._load_task = None
+
+    async def load_all(self):
+        """Query the watched members of every guild (on ready)"""
+        for guild in self._bot.guilds:
+            await self._query(guild, self._watchlist.members(guild.id))
+
+    def on_watchlist_change(self, op, guild_id, user_id):
+        """Watchlist listener: load newly watched members, evict unwatched ones"""
+        guild = self._bot.get_guild(guild_id)
+        if guild is None:
+            return
+        if op == "add":
+            self._pending.setdefault(guild_id, set()).add(user_id)
+            if self._load_task is None or self._load_task.done():
+                self._load_task = asyncio.get_running_loop().create_task(self._load_pending())
+        else:
+            member = guild.get_member(user_id)
+            if member is not None and member is not guild.me:
+                # No public API for evicting a single member
+                guild._remove_member(member)
+
+    async def _load_pending(self):
+        # Coalesce bulk additions into as few queries as possible
+        await asyncio.sleep(LOAD_DELAY)
+        while self._pending:
+            guild_id, user_ids = self._pending.popitem()
+            guild = self._bot.get_guild(guild_id)
+            if guild is not None:
+                await self._query(guild, sorted(user_ids))
+
+    async def _query(self, guild, user_ids):
+        for start in range(0, len(user_ids), QUERY_BATCH_SIZE):
+            batch = [user_id for user_id in user_ids[start:start + QUERY_BATCH_SIZE] if guild.get_member(user_id) is None]
+            if not batch:
+                continue
+            try:
+                await guild.query_members(user_ids=batch, limit=len(batch), cache=True)
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                print(f"Error loading watched members in {guild.name}: {e}")
@@ -0,0 +1,179 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Local archive of every logged monitored message, searchable with !search
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "1") == "1"
+ARCHIVE_FILE = os.getenv("ARCHIVE_FILE", "message_archive.db")
+
+# Rows written per transaction, and the longest a row waits for a batch to fill
+ARCHIVE_BATCH_SIZE = 500
+ARCHIVE_BATCH_DELAY = 1.0
+
+# Rows waiting for the writer thread before new ones are dropped
+ARCHIVE_QUEUE_SIZE = 50000
+
+_STOP = object()
+
+
+class MessageArchive:
+    """SQLite archive of monitored messages with an FTS5 full-text index
+
+    add() only puts the row on a queue. A writer thread inserts rows in
+    batches, one transaction each, so the cost per message stays flat
+    under load. Searches use their own connection; WAL mode keeps them
+    from waiting on the writer.
+    """
+
+    def __init__(self, path=ARCHIVE_FILE):
+        self.path = path
+        self._queue = queue.Queue(maxsize=ARCHIVE_QUEUE_SIZE)
+        self.archived = 0
+        self.dropped = 0
+
+        db = self._connect()
+        with db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "message_id INTEGER PRIMARY KEY, "
+                "guild_id INTEGER NOT NULL, "
+                "channel_id INTEGER NOT NULL, "
+                "author_id INTEGER NOT NULL, "
+                "author_name TEXT NOT NULL, "
+                "content TEXT NOT NULL, "
+                "attachments TEXT NOT NULL, "
+                "created_at INTEGER NOT NULL"
+                ")"
+            )
+            columns = [row[1] for row in db.execute("PRAGMA table_info(messages_fts)")]
+            if columns and "guild_id" not in columns:
+                # Archives created before searches were limited to one guild inside the index
+                db.execute("DROP TRIGGER IF EXISTS messages_fts_insert")
+                db.execute("DROP TABLE messages_fts")
+                columns = []
+            # External-content FTS table: the text is stored once, in messages. guild_id
+            # is indexed too, so a search only ranks the matches of its own guild.
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                "content, author_name, guild_id, content='messages', content_rowid='message_id'"
+                ")"
+            )
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+                "INSERT INTO messages_fts (rowid, content, author_name, guild_id) "
+                "VALUES (new.message_id, new.content, new.author_name, new.guild_id); "
+                "END"
+            )
+            if not columns:
+                # Every row of a guild has its ID, which says nothing about how well it matches
+                db.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('rank', 'bm25(1.0, 1.0, 0.0)')")
+                db.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+        self._writer_db = db
+        self._reader_db = self._connect()
+        self._reader_lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name="message-archive", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("PRAGMA busy_timeout=5000")
+        return db
+
+    def add(self, message):
+        """Queue a monitored message for archiving (never blocks)"""
+        row = (
+            message.id,
+            message.guild.id,
+            message.channel.id,
+            message.author.id,
+            str(message.author),
+            message.content or "",
+            json.dumps([[attachment.filename, attachment.url] for attachment in message.attachments]),
+            int(message.created_at.timestamp()),
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def queued(self):
+        return self._queue.qsize()
+
+    def _write_loop(self):
+        while True:
+            row = self._queue.get()
+            if row is _STOP:
+                return
+            batch = [row]
+            stop = False
+            # Gather whatever else arrives shortly into the same transaction. The
+            # delay counts from the first row, so a slow trickle still commits every second.
+            deadline = time.monotonic() + ARCHIVE_BATCH_DELAY
+            try:
+                while len(batch) < ARCHIVE_BATCH_SIZE:
+                    row = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                    if row is _STOP:
+                        stop = True
+                        break
+                    batch.append(row)
+            except queue.Empty:
+                pass
+            try:
+                with self._writer_db:
+                    self._writer_db.executemany(
+                        "INSERT OR IGNORE INTO messages "
+                        "(message_id, guild_id, channel_id, author_id, author_name, content, attachments, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        batch,
+                    )
+                self.archived += len(batch)
+            except sqlite3.Error as e:
+                print(f"Error archiving monitored messages: {e}")
+            if stop:
+                return
+
+    def search(self, guild_id, query, limit=10):
+        """Full-text search a guild's archive, best matches first (blocking, run in a thread)"""
+        # The guild is matched inside the index, so FTS5 only ranks that guild's rows. The
+        # m.guild_id check stays in case the query's own operators reach past the AND.
+        sql = (
+            "SELECT m.message_id, m.channel_id, m.author_id, m.author_name, m.created_at, "
+            "snippet(messages_fts, 0, '**', '**', '…', 16) "
+            "FROM messages_fts JOIN messages m ON m.message_id = messages_fts.rowid "
+            "WHERE messages_fts MATCH ? AND m.guild_id = ? "
+            "ORDER BY messages_fts.rank LIMIT ?"
+        )
+        match = f'guild_id:"{int(guild_id)}" AND {{content author_name}}: ({query})'
+        with self._reader_lock:
+            try:
+                rows = self._reader_db.execute(sql, (match, guild_id, limit)).fetchall()
+            except sqlite3.OperationalError:
+                # Not valid FTS5 syntax, search for it as a plain phrase instead
+                phrase = '"' + query.replace('"', '""') + '"'
+                match = f'guild_id:"{int(guild_id)}" AND {{content author_name}}: {phrase}'
+                rows = self._reader_db.execute(sql, (match, guild_id, limit)).fetchall()
+        return [
+            {
+                "message_id": message_id,
+                "channel_id": channel_id,
+                "author_id": author_id,
+                "author_name": author_name,
+                "created_at": created_at,
+                "snippet": snippet,
+            }
+            for message_id, channel_id, author_id, author_name, created_at, snippet in rows
+        ]
+
+    def close(self):
+        """Write out queued rows and stop the writer thread"""
+        self._queue.put(_STOP)
+        self._writer.join(timeout=10)
+        with self._reader_lock:
+            self._reader_db.close()
+        if not self._writer.is_alive():
+            self._writer_db.close()
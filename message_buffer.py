@@ -0,0 +1,141 @@
+import collections
+import os
+
+# Memory ceilings for buffered monitored messages (approximate bytes)
+MESSAGE_BUFFER_BYTES = int(os.getenv("MESSAGE_BUFFER_BYTES", str(32 * 1024 * 1024)))
+MESSAGE_BUFFER_GUILD_BYTES = int(os.getenv("MESSAGE_BUFFER_GUILD_BYTES", str(2 * 1024 * 1024)))
+
+# Per-record caps, longer content or attachment lists are cut
+MAX_CONTENT_CHARS = 4000
+MAX_ATTACHMENTS = 10
+
+# Rough fixed cost of a record and its dict entries on CPython
+RECORD_OVERHEAD = 400
+
+
+class MessageRecord:
+    """What's needed to log an edit or delete of a monitored message"""
+
+    __slots__ = ("message_id", "guild_id", "channel_id", "author_id", "author_name", "content", "attachments", "created_at", "size")
+
+    def __init__(self, message_id, guild_id, channel_id, author_id, author_name, content, attachments, created_at):
+        self.message_id = message_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.author_name = author_name
+        self.content = content[:MAX_CONTENT_CHARS]
+        # Tuple of (filename, url)
+        self.attachments = tuple(attachments[:MAX_ATTACHMENTS])
+        self.created_at = created_at
+        self.size = self._measure()
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(
+            message.id,
+            message.guild.id,
+            message.channel.id,
+            message.author.id,
+            str(message.author),
+            message.content or "",
+            [(attachment.filename, attachment.url) for attachment in message.attachments],
+            message.created_at,
+        )
+
+    def _measure(self):
+        size = RECORD_OVERHEAD + len(self.author_name) + len(self.content.encode())
+        for filename, url in self.attachments:
+            size += len(filename) + len(url) + 100
+        return size
+
+    def set_content(self, content):
+        self.content = content[:MAX_CONTENT_CHARS]
+        self.size = self._measure()
+
+
+class RecentMessageBuffer:
+    """Memory-bounded ring buffer of recent monitored messages, looked up by message ID
+
+    Records live in one insertion-ordered dict, so lookups are O(1) and the
+    oldest records are evicted first once the total passes max_bytes. Each
+    guild also gets at most guild_max_bytes, so one busy guild can't push
+    every other guild's history out.
+    """
+
+    def __init__(self, max_bytes=MESSAGE_BUFFER_BYTES, guild_max_bytes=MESSAGE_BUFFER_GUILD_BYTES):
+        self.max_bytes = max_bytes
+        self.guild_max_bytes = guild_max_bytes
+        # message_id -> MessageRecord, oldest first
+        self._records = collections.OrderedDict()
+        # guild_id -> deque of message IDs in that guild, oldest first (may hold evicted IDs)
+        self._guild_order = {}
+        self._guild_bytes = {}
+        self.bytes = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def add(self, record):
+        """Buffer a record, evicting the oldest ones past the memory ceilings"""
+        self.pop(record.message_id)
+        self._records[record.message_id] = record
+        self._guild_order.setdefault(record.guild_id, collections.deque()).append(record.message_id)
+        self._guild_bytes[record.guild_id] = self._guild_bytes.get(record.guild_id, 0) + record.size
+        self.bytes += record.size
+
+        order = self._guild_order[record.guild_id]
+        while self._guild_bytes[record.guild_id] > self.guild_max_bytes and len(order) > 1:
+            self._evict(self._records.get(order.popleft()), record.guild_id)
+        # Every record costs at least RECORD_OVERHEAD, which bounds the live count
+        if len(order) > 2 * (self._guild_bytes[record.guild_id] // RECORD_OVERHEAD) + 64:
+            # Too many IDs of deleted/evicted messages piled up, rebuild the order
+            self._guild_order[record.guild_id] = collections.deque(
+                message_id for message_id in order
+                if (buffered := self._records.get(message_id)) is not None and buffered.guild_id == record.guild_id
+            )
+        while self.bytes > self.max_bytes and len(self._records) > 1:
+            _, oldest = self._records.popitem(last=False)
+            self._account_removed(oldest)
+            self.evicted += 1
+
+    def _evict(self, record, guild_id):
+        # IDs already evicted globally are skipped lazily
+        if record is not None and record.guild_id == guild_id:
+            del self._records[record.message_id]
+            self._account_removed(record)
+            self.evicted += 1
+
+    def get(self, message_id):
+        return self._records.get(message_id)
+
+    def pop(self, message_id):
+        """Remove and return a record (None if it isn't buffered)"""
+        record = self._records.pop(message_id, None)
+        if record is not None:
+            self._account_removed(record)
+        return record
+
+    def update_content(self, message_id, content):
+        """Replace a record's content after an edit, returns the previous content (None if not buffered)"""
+        record = self._records.get(message_id)
+        if record is None:
+            return None
+        previous = record.content
+        self._guild_bytes[record.guild_id] -= record.size
+        self.bytes -= record.size
+        record.set_content(content)
+        self._guild_bytes[record.guild_id] += record.size
+        self.bytes += record.size
+        return previous
+
+    def _account_removed(self, record):
+        self.bytes -= record.size
+        remaining = self._guild_bytes[record.guild_id] - record.size
+        if remaining > 0:
+            self._guild_bytes[record.guild_id] = remaining
+        else:
+            # Last record of the guild gone, drop its bookkeeping
+            del self._guild_bytes[record.guild_id]
+            self._guild_order.pop(record.guild_id, None)
@@ -0,0 +1,299 @@
+import asyncio
+import bisect
+import logging
+import math
+import os
+
+import aiohttp
+from aiohttp import web
+
+# Local Prometheus endpoint, METRICS_PORT=0 turns it off
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# Histogram bucket upper bounds in seconds, from a dict lookup to a slow REST call
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One slot per bucket plus +Inf, not cumulative (summed up when rendered)
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls in"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else math.inf
+        return math.inf
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Tuple of label values -> value object
+        self._values = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        """Return the child for these label values (hot paths should look it up once and keep it)"""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        child = self._values.get(values)
+        if child is None:
+            child = self._values[values] = self._new_value()
+        return child
+
+    def _label_text(self, values, extra=()):
+        return _label_text(self.labelnames, values, extra)
+
+    def items(self):
+        return sorted(self._values.items())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_value(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def render(self):
+        lines = []
+        for values, child in self.items():
+            lines.append(f"{self.name}{self._label_text(values)} {child.value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def render(self):
+        lines = []
+        for values, child in self.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                lines.append(f"{self.name}_bucket{self._label_text(values, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(values)} {child.sum}")
+            lines.append(f"{self.name}_count{self._label_text(values)} {child.count}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback whenever metrics are rendered (queue depths, cache sizes)
+
+    With labelnames, func returns a dict of label value tuples to values.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, func, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.labelnames = tuple(labelnames)
+
+    def items(self):
+        if not self.labelnames:
+            return [((), self.func())]
+        return sorted(self.func().items())
+
+    def render(self):
+        return [f"{self.name}{_label_text(self.labelnames, values)} {value}" for values, value in self.items()]
+
+
+class Registry:
+    """Every metric the process exports, in registration order"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, func, labelnames=()):
+        return self._register(Gauge(name, documentation, func, labelnames))
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def metrics(self):
+        return list(self._metrics.values())
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.render()
+            except Exception as e:
+                print(f"Error collecting metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+# The process-wide registry every module records into
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+gauge = REGISTRY.gauge
+
+
+REST_REQUESTS = counter("tracker_rest_requests_total", "Discord REST API requests by method and status", ["method", "status"])
+REST_REQUEST_SECONDS = histogram("tracker_rest_request_seconds", "Discord REST API request latency (one attempt, without rate limit waits)", ["method"])
+RATE_LIMIT_WAITS = counter("tracker_rate_limit_waits_total", "429 responses the library slept on before retrying", ["scope"])
+RATE_LIMIT_WAIT_SECONDS = histogram("tracker_rate_limit_wait_seconds", "Time slept on 429 responses before retrying", ["scope"])
+
+
+def rest_trace_config(on_response=None):
+    """aiohttp trace hooks that time every REST request the library makes (pass as http_trace)
+
+    on_response(method, path, status, headers) is also called for every
+    response, so rate limit headers can be tracked outside the library.
+    """
+
+    async def on_request_start(session, context, params):
+        context.started = asyncio.get_running_loop().time()
+
+    async def on_request_end(session, context, params):
+        REST_REQUESTS.labels(params.method, str(params.response.status)).inc()
+        REST_REQUEST_SECONDS.labels(params.method).observe(asyncio.get_running_loop().time() - context.started)
+        if on_response is not None:
+            on_response(params.method, params.url.path, params.response.status, params.response.headers)
+
+    async def on_request_exception(session, context, params):
+        REST_REQUESTS.labels(params.method, "error").inc()
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+class RateLimitLogHandler(logging.Handler):
+    """Counts the library's 429 retries from the warnings discord.http logs for them
+
+    discord.py has no rate limit event, but every 429 it sleeps on is
+    logged with the retry delay as an argument.
+    """
+
+    def emit(self, record):
+        if record.levelno != logging.WARNING or not isinstance(record.args, tuple) or not record.args:
+            return
+        if record.msg.startswith("We are being rate limited.") and "Retrying in" in record.msg:
+            scope = "route"
+        elif record.msg.startswith("Global rate limit has been hit."):
+            scope = "global"
+        else:
+            return
+        RATE_LIMIT_WAITS.labels(scope).inc()
+        RATE_LIMIT_WAIT_SECONDS.labels(scope).observe(float(record.args[-1]))
+
+
+def install_rate_limit_handler():
+    logger = logging.getLogger("discord.http")
+    if not any(isinstance(handler, RateLimitLogHandler) for handler in logger.handlers):
+        logger.addHandler(RateLimitLogHandler())
+
+
+class MetricsServer:
+    """Serves REGISTRY at /metrics for Prometheus to scrape"""
+
+    def __init__(self, registry=REGISTRY, host=METRICS_HOST, port=METRICS_PORT):
+        self._registry = registry
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            # Metrics are optional, never keep the bot from starting
+            print(f"Error starting metrics endpoint on {self.host}:{self.port}: {e}")
+            await self.close()
+            return
+        print(f"Metrics endpoint: http://{self.host}:{self.port}/metrics")
+
+    async def _handle(self, request):
+        return web.Response(text=self._registry.render(), content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,37 @@
+import os
+import sys
+
+from storage import DATABASE_FILE, JOURNAL_FILE, MONITORED_FILE, JsonStore, SqliteStore
+from watch_rules import JsonRuleStore, SqliteRuleStore
+
+# One-shot migration of monitored_users.json (and its journal) into watchlist.db
+db_path = os.getenv("WATCHLIST_DB", DATABASE_FILE)
+force = "--force" in sys.argv
+
+json_store = JsonStore(MONITORED_FILE, JOURNAL_FILE)
+data = json_store.load()
+expiries = json_store.load_expiries()
+# Carry the audit trail over too so !history keeps working
+history = list(json_store.events())
+# The bot keeps watch rules in the database too once it runs on it
+rules = JsonRuleStore().load()
+
+db_store = SqliteStore(db_path)
+if db_store.load() and not force:
+    print(f"{db_path} already contains a watchlist, refusing to migrate again.")
+    print("Run with --force to merge monitored_users.json into it anyway.")
+    sys.exit(1)
+
+db_store.import_watchlist(data, history, expiries)
+db_store.close()
+rules_store = SqliteRuleStore(db_path)
+rules_store.import_rules(rules)
+rules_store.close()
+
+print("Discord Bot Watchlist Migration")
+print("=" * 40)
+print(f"Monitored users migrated: {sum(len(user_ids) for user_ids in data.values())}")
+print(f"Servers migrated: {len(data)}")
+print(f"Journal events copied: {len(history)}")
+print(f"Watch rules migrated: {sum(len(guild_rules) for guild_rules in rules.values())}")
+print(f"\nSet WATCHLIST_BACKEND=sqlite to run the bot on {db_path}.")
@@ -0,0 +1,257 @@
+import asyncio
+import collections
+import os
+import time
+
+import metrics
+
+# Priority lanes, lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+BULK = 2
+LANE_NAMES = ("interactive", "background", "bulk")
+
+# Discord's global limit is 50 requests per second per bot token (large bots can get
+# more). Both are per process: shards.py hands each worker its share of the budget.
+GLOBAL_RATE = float(os.getenv("REST_GLOBAL_RATE", "50"))
+# Part of the global budget background and bulk work never use, so replies can go out at once
+INTERACTIVE_RESERVE = float(os.getenv("REST_INTERACTIVE_RESERVE", "10"))
+
+# Requests each lane may have waiting, beyond that new ones are refused (None: unbounded)
+LANE_MAX_QUEUED = (None, 200, 100)
+# Seconds a request may wait for its turn before it is given up on (None: forever)
+LANE_MAX_WAIT = (None, 30.0, 10.0)
+
+# Route buckets remembered before expired ones are pruned
+MAX_BUCKETS = 10000
+
+# Path segments whose ID is a major parameter, i.e. part of the rate limit bucket
+MAJOR_PARAMETERS = ("channels", "guilds", "webhooks")
+
+QUEUE_WAIT_SECONDS = metrics.histogram("tracker_rest_queue_wait_seconds", "Time REST requests waited in the outbound scheduler", ["lane"])
+SCHEDULER_DROPS = metrics.counter("tracker_rest_dropped_total", "REST requests the outbound scheduler refused or gave up on", ["lane", "reason"])
+
+
+class SchedulerBusy(Exception):
+    """Raised when low-priority work is refused or waited too long, callers should degrade"""
+
+
+def route_key(method, path):
+    """Rate limit bucket key for a request, e.g. "POST /channels/123/messages" or "GET /users/{id}" """
+    parts = path.strip("/").split("/")
+    if parts[:2] == ["api", "v10"]:
+        parts = parts[2:]
+    key = []
+    for index, part in enumerate(parts):
+        if part.isdigit() and not (index and parts[index - 1] in MAJOR_PARAMETERS):
+            part = "{id}"
+        key.append(part)
+    return f"{method} /" + "/".join(key)
+
+
+class _Bucket:
+    __slots__ = ("remaining", "reset_at")
+
+    def __init__(self):
+        # Unknown until Discord's rate limit headers for the route have been seen
+        self.remaining = None
+        self.reset_at = 0.0
+
+
+class _Request:
+    __slots__ = ("lane", "key", "future", "queued_at", "deadline")
+
+    def __init__(self, lane, key, future, queued_at, deadline):
+        self.lane = lane
+        self.key = key
+        self.future = future
+        self.queued_at = queued_at
+        self.deadline = deadline
+
+
+class RestScheduler:
+    """Orders outbound REST calls by priority lane and per-route rate limit buckets
+
+    Every call waits for a turn: the highest-priority queued request whose
+    bucket has requests left goes first, and background and bulk work
+    leaves part of the global limit to interactive replies. Buckets are
+    tracked from Discord's X-RateLimit headers (fed in by observe()) and
+    counted down as requests go out, so a flood of log sends waits here
+    instead of in front of a moderator's reply inside the library.
+
+    Background and bulk lanes are bounded: run() raises SchedulerBusy when
+    a lane is full or a request waited past its lane's limit.
+    """
+
+    def __init__(self, global_rate=GLOBAL_RATE, interactive_reserve=INTERACTIVE_RESERVE,
+                 max_queued=LANE_MAX_QUEUED, max_wait=LANE_MAX_WAIT):
+        self._global_rate = global_rate
+        self._reserve = interactive_reserve
+        self._max_queued = max_queued
+        self._max_wait = max_wait
+        self._lanes = [collections.deque() for _ in LANE_NAMES]
+        self._buckets = {}
+        # Room for at least one background request over the reserve, however small a share this process has
+        self._capacity = max(float(global_rate), 1 + interactive_reserve)
+        self._tokens = self._capacity
+        self._refilled_at = time.monotonic()
+        self._wakeup = None
+        self._task = None
+        self.dispatched = [0] * len(LANE_NAMES)
+        self.dropped = [0] * len(LANE_NAMES)
+        self._wait_seconds = [QUEUE_WAIT_SECONDS.labels(name) for name in LANE_NAMES]
+
+    def queued(self, lane=None):
+        """Return the number of requests waiting, in one lane or all of them"""
+        if lane is not None:
+            return len(self._lanes[lane])
+        return sum(len(requests) for requests in self._lanes)
+
+    async def run(self, lane, method, path, func, *args, **kwargs):
+        """Wait for a turn in the lane, then return await func(*args, **kwargs)"""
+        await self._acquire(lane, route_key(method, path))
+        return await func(*args, **kwargs)
+
+    async def _acquire(self, lane, key):
+        max_queued = self._max_queued[lane]
+        if max_queued is not None and len(self._lanes[lane]) >= max_queued:
+            self._drop(lane, "full")
+            raise SchedulerBusy(f"{LANE_NAMES[lane]} lane is full")
+
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        max_wait = self._max_wait[lane]
+        request = _Request(lane, key, loop.create_future(), now, now + max_wait if max_wait is not None else None)
+        self._lanes[lane].append(request)
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._dispatch_loop())
+        self._wakeup.set()
+        try:
+            await request.future
+        except asyncio.CancelledError:
+            # The dispatcher skips requests nobody waits for anymore
+            request.future.cancel()
+            raise
+
+    def _drop(self, lane, reason):
+        self.dropped[lane] += 1
+        SCHEDULER_DROPS.labels(LANE_NAMES[lane], reason).inc()
+
+    def observe(self, method, path, status, headers):
+        """Update a route's bucket from a response's rate limit headers"""
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_after = headers.get("X-RateLimit-Reset-After")
+        if status == 429:
+            remaining = "0"
+            reset_after = headers.get("Retry-After", reset_after)
+        if remaining is None or reset_after is None:
+            return
+        try:
+            remaining = int(remaining)
+            reset_at = time.monotonic() + float(reset_after)
+        except ValueError:
+            return
+        key = route_key(method, path)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= MAX_BUCKETS:
+                # One bucket per channel and guild adds up, forget the ones whose window is over
+                now = time.monotonic()
+                self._buckets = {k: b for k, b in self._buckets.items() if b.reset_at > now}
+            bucket = self._buckets[key] = _Bucket()
+        bucket.remaining = remaining
+        bucket.reset_at = reset_at
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _refill(self, now):
+        self._tokens = min(self._capacity, self._tokens + (now - self._refilled_at) * self._global_rate)
+        self._refilled_at = now
+
+    def _next_request(self, now):
+        """Pop the first request that may go now, or return the time to look again"""
+        wake_at = None
+        for lane, requests in enumerate(self._lanes):
+            if not requests:
+                continue
+            # Lower lanes leave the reserved part of the global limit alone
+            needed = 1 if lane == INTERACTIVE else 1 + self._reserve
+            if self._tokens < needed:
+                at = now + (needed - self._tokens) / self._global_rate
+                wake_at = at if wake_at is None else min(wake_at, at)
+                continue
+            blocked = set()
+            for request in requests:
+                if request.key in blocked:
+                    # Keep each route's requests in order
+                    continue
+                bucket = self._buckets.get(request.key)
+                if bucket is not None and bucket.remaining is not None and bucket.remaining <= 0:
+                    if now < bucket.reset_at:
+                        blocked.add(request.key)
+                        wake_at = bucket.reset_at if wake_at is None else min(wake_at, bucket.reset_at)
+                        continue
+                    # Window passed, the next response tells us the new numbers
+                    bucket.remaining = None
+                requests.remove(request)
+                return request, None
+        return None, wake_at
+
+    def _expire(self, now):
+        # Drop cancelled requests and give up on those past their lane's wait limit
+        for lane, requests in enumerate(self._lanes):
+            expired = [r for r in requests if r.future.done() or (r.deadline is not None and now >= r.deadline)]
+            for request in expired:
+                requests.remove(request)
+                if not request.future.done():
+                    self._drop(lane, "timeout")
+                    request.future.set_exception(SchedulerBusy(f"{LANE_NAMES[lane]} request waited too long"))
+
+    async def _dispatch_loop(self):
+        while self.queued():
+            now = time.monotonic()
+            self._refill(now)
+            self._expire(now)
+            request, wake_at = self._next_request(now)
+            if request is not None:
+                self._tokens -= 1
+                bucket = self._buckets.get(request.key)
+                if bucket is not None and bucket.remaining is not None:
+                    bucket.remaining -= 1
+                self.dispatched[request.lane] += 1
+                self._wait_seconds[request.lane].observe(now - request.queued_at)
+                request.future.set_result(None)
+                # Let the granted request start before picking the next one
+                await asyncio.sleep(0)
+                continue
+
+            # Nothing may go yet: sleep until a bucket resets, a deadline passes or something changes
+            deadlines = [r.deadline for requests in self._lanes for r in requests if r.deadline is not None]
+            if deadlines:
+                wake_at = min(deadlines) if wake_at is None else min(wake_at, min(deadlines))
+            self._wakeup.clear()
+            timeout = None if wake_at is None else max(0.0, wake_at - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        """Return per-lane queue depth, dispatched and dropped counts"""
+        return {
+            name: {"queued": len(self._lanes[lane]), "dispatched": self.dispatched[lane], "dropped": self.dropped[lane]}
+            for lane, name in enumerate(LANE_NAMES)
+        }
+
+    async def close(self, timeout=5):
+        """Give queued requests a chance to go out, then stop dispatching"""
+        if self._task is not None and not self._task.done():
+            await asyncio.wait([self._task], timeout=timeout)
+            self._task.cancel()
+        for lane, requests in enumerate(self._lanes):
+            while requests:
+                request = requests.popleft()
+                if not request.future.done():
+                    self._drop(lane, "shutdown")
+                    request.future.set_exception(SchedulerBusy("shutting down"))
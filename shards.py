@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+from rest_scheduler import GLOBAL_RATE, INTERACTIVE_RESERVE
+
+# Discord allows one shard IDENTIFY per 5 seconds (per max_concurrency bucket)
+IDENTIFY_INTERVAL = 5.5
+
+# Seconds to wait before restarting a worker process that exited
+RESTART_DELAY = 10
+
+
+def parse_shard_ids(text):
+    """Parse shard IDs like "0-3,8" into [0, 1, 2, 3, 8]"""
+    shard_ids = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            shard_ids.extend(range(int(first), int(last) + 1))
+        else:
+            shard_ids.append(int(part))
+    return shard_ids
+
+
+def split_shards(shard_count, processes):
+    """Split shards 0..shard_count-1 into contiguous ranges, one per process"""
+    processes = min(processes, shard_count)
+    size, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for index in range(processes):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def recommended_shard_count(token):
+    """Ask Discord how many shards the bot should run"""
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {token}", "User-Agent": "DiscordBot (user-tracker, 1.0)"},
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)["shards"]
+
+
+def start_worker(index, shard_ids, shard_count, processes):
+    env = dict(os.environ, SHARDED="1", SHARD_COUNT=str(shard_count), SHARD_IDS=",".join(map(str, shard_ids)))
+    # Discord's global rate limit is per bot token, so the workers split it (and the interactive reserve)
+    env["REST_GLOBAL_RATE"] = str(GLOBAL_RATE / processes)
+    env["REST_INTERACTIVE_RESERVE"] = str(INTERACTIVE_RESERVE / processes)
+    # Each worker serves its metrics on the next port up
+    metrics_port = int(os.getenv("METRICS_PORT", "9108"))
+    if metrics_port:
+        env["METRICS_PORT"] = str(metrics_port + index)
+    main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    return subprocess.Popen([sys.executable, main_py], env=env)
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Run the bot's shards across several worker processes")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="worker processes to start")
+    parser.add_argument("--shard-count", type=int, help="total shards (default: Discord's recommendation)")
+    args = parser.parse_args()
+
+    token = os.getenv("DISCORD_TOKEN")
+    if not token:
+        print("ERROR: DISCORD_TOKEN environment variable not found!")
+        sys.exit(1)
+
+    # Every process needs to see the others' watchlist changes
+    if os.getenv("WATCHLIST_BACKEND", "json") != "sqlite":
+        print("ERROR: Running several processes needs the shared SQLite watchlist.")
+        print("Set WATCHLIST_BACKEND=sqlite (run migrate_watchlist.py first to keep the current list).")
+        sys.exit(1)
+
+    shard_count = args.shard_count or recommended_shard_count(token)
+    ranges = split_shards(shard_count, args.processes)
+
+    print("Discord Bot Shard Launcher")
+    print("=" * 40)
+    print(f"Total shards: {shard_count}")
+    print(f"Worker processes: {len(ranges)}")
+    print(f"REST budget per process: {GLOBAL_RATE / len(ranges):g} requests/s")
+
+    workers = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in workers.values():
+            process.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for index, shard_ids in enumerate(ranges):
+        if stopping:
+            break
+        print(f"Starting shards {shard_ids[0]}-{shard_ids[-1]}")
+        workers[index] = start_worker(index, shard_ids, shard_count, len(ranges))
+        # Let this process identify its shards before the next one starts
+        time.sleep(len(shard_ids) * IDENTIFY_INTERVAL)
+
+    while workers:
+        for index, process in list(workers.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            if stopping:
+                del workers[index]
+                continue
+            shard_ids = ranges[index]
+            print(f"Shards {shard_ids[0]}-{shard_ids[-1]} exited with code {code}, restarting in {RESTART_DELAY}s")
+            time.sleep(RESTART_DELAY)
+            workers[index] = start_worker(index, shard_ids, shard_count, len(ranges))
+        time.sleep(1)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,661 @@
+import glob
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+
+# Default locations of the watchlist for each backend
+MONITORED_FILE = "monitored_users.json"
+JOURNAL_FILE = "monitored_users.journal"
+# When time-bounded entries end, as of the last compaction (the journal has later changes)
+EXPIRY_FILE = "monitored_users.expiries.json"
+DATABASE_FILE = "watchlist.db"
+
+# "json" (snapshot + journal files) or "sqlite"
+WATCHLIST_BACKEND = os.getenv("WATCHLIST_BACKEND", "json")
+
+# Compact the journal into a fresh snapshot once it grows past this size
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+# Read once at import, os.umask() can only be queried by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class WatchlistLoadError(Exception):
+    """Raised when a watchlist file exists but cannot be read back"""
+
+
+def load_json_file(path):
+    """Load a {"guild_id": ["user_id", ...]} watchlist file, {} if it doesn't exist"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        # Never treat an unreadable file as an empty watchlist
+        raise WatchlistLoadError(f"Could not read {path}: {e}") from e
+
+    if not isinstance(data, dict) or not all(isinstance(v, list) for v in data.values()):
+        raise WatchlistLoadError(f"Could not read {path}: unexpected layout")
+    return data
+
+
+def atomic_write_json(path, data):
+    """Write JSON compactly via temp file, fsync and rename so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+            # mkstemp creates the file 0600, keep the permissions of the file being replaced
+            os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    _fsync_directory(directory)
+
+
+def _file_mode(path):
+    try:
+        return os.stat(path).st_mode & 0o777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def _fsync_directory(directory):
+    """Make the rename itself durable (not supported on every platform)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# Ops that end monitoring: removed by a moderator, or the monitoring period ran out
+REMOVE_OPS = ("remove", "expire")
+
+
+def make_event(op, guild_id, user_id, by=None, expires_at=None):
+    """Build a journal event for a watchlist change
+
+    An "add" with expires_at (unix time) monitors the user until then, an
+    "add" without it monitors them for good.
+    """
+    event = {"op": op, "g": guild_id, "u": user_id, "by": by, "ts": int(time.time())}
+    if expires_at is not None:
+        event["exp"] = expires_at
+    return event
+
+
+def apply_expiry(expiries, event):
+    """Apply a journal event to a {(guild_id, user_id): expires_at} mapping"""
+    key = (event["g"], event["u"])
+    if event["op"] == "add" and event.get("exp") is not None:
+        expiries[key] = event["exp"]
+    else:
+        expiries.pop(key, None)
+
+
+def apply_event(data, event):
+    """Apply a journal event to a {guild_id: set(user_id)} mapping"""
+    if event["op"] == "add":
+        data.setdefault(event["g"], set()).add(event["u"])
+    elif event["op"] in REMOVE_OPS:
+        users = data.get(event["g"])
+        if users is not None:
+            users.discard(event["u"])
+            if not users:
+                del data[event["g"]]
+
+
+def read_journal(path):
+    """Yield the events of a journal file, skipping a torn last line"""
+    try:
+        f = open(path)
+    except FileNotFoundError:
+        return
+    with f:
+        yield from _read_journal_lines(f, path)
+
+
+def _read_journal_lines(f, path):
+    for line_number, line in enumerate(f, 1):
+        if not line.endswith("\n"):
+            # Partial append from a crash or an in-progress write
+            return
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise WatchlistLoadError(f"Could not read {path} line {line_number}: {e}") from e
+
+
+# Pieces of the snapshot layout: the opening brace, then one guild entry at a time
+_SNAPSHOT_START = re.compile(r"\s*\{")
+_SNAPSHOT_ENTRY = re.compile(r'\s*(?:"(\d+)"\s*:\s*(\[[^\]]*\])\s*([,}])|(\}))')
+_SNAPSHOT_CHUNK_SIZE = 1024 * 1024
+
+
+def iter_snapshot(f, path):
+    """Stream (guild_id, user_id) pairs out of a {"guild_id": ["user_id", ...]} file, one guild after another
+
+    Reads the file in chunks and decodes one guild's list at a time, so
+    memory use doesn't grow with the size of the watchlist.
+    """
+    buffer = ""
+    position = 0
+    eof = False
+    pattern = _SNAPSHOT_START
+    first = True
+    while True:
+        match = pattern.match(buffer, position)
+        if match is None:
+            if eof:
+                raise WatchlistLoadError(f"Could not read {path}: unexpected layout")
+            # The entry may continue in the next chunk
+            chunk = f.read(_SNAPSHOT_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        position = match.end()
+        if pattern is _SNAPSHOT_START:
+            pattern = _SNAPSHOT_ENTRY
+            continue
+        if match.group(4) is not None:
+            # "}" is only valid as the whole of an empty watchlist
+            if not first:
+                raise WatchlistLoadError(f"Could not read {path}: unexpected layout")
+            break
+        first = False
+        guild_id = int(match.group(1))
+        try:
+            user_ids = json.loads(match.group(2))
+        except ValueError as e:
+            raise WatchlistLoadError(f"Could not read {path}: {e}") from e
+        for user_id in user_ids:
+            if not (isinstance(user_id, int) or isinstance(user_id, str) and user_id.isdigit()):
+                raise WatchlistLoadError(f"Could not read {path}: unexpected layout")
+            yield guild_id, int(user_id)
+        if match.group(3) == "}":
+            break
+
+    # Nothing but whitespace may follow
+    rest = buffer[position:]
+    while True:
+        if rest.strip():
+            raise WatchlistLoadError(f"Could not read {path}: unexpected layout")
+        if eof:
+            return
+        rest = f.read(_SNAPSHOT_CHUNK_SIZE)
+        eof = not rest
+
+
+def open_store(backend=None, readonly=False):
+    """Open the configured watchlist store"""
+    backend = backend or WATCHLIST_BACKEND
+    if backend == "json":
+        return JsonStore(MONITORED_FILE, JOURNAL_FILE, expiry_path=EXPIRY_FILE)
+    if backend == "sqlite":
+        return SqliteStore(os.getenv("WATCHLIST_DB", DATABASE_FILE), readonly=readonly)
+    raise ValueError(f"Unknown watchlist backend: {backend}")
+
+
+class WatchlistStore:
+    """Interface shared by the watchlist storage backends
+
+    Methods are blocking and are called from worker threads, one at a time
+    for writes.
+    """
+
+    # True if several bot processes can share the store (see changes())
+    shared = False
+
+    def load(self):
+        """Return every monitored user as {guild_id: set(user_id)}"""
+        raise NotImplementedError
+
+    def append(self, events):
+        """Persist a batch of journal events (see make_event)"""
+        raise NotImplementedError
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, snapshot, expiries=None):
+        """Rewrite the store from a full {"guild_id": ["user_id", ...]} snapshot
+
+        expiries is the {"guild_id": [["user_id", expires_at], ...]} layout
+        of the time-bounded entries.
+        """
+
+    def load_expiries(self):
+        """Return {(guild_id, user_id): expires_at} for users monitored for a limited time"""
+        return {}
+
+    def history(self, guild_id, user_id, limit=10):
+        """Return the latest events for a user in a guild, newest first"""
+        raise NotImplementedError
+
+    def changes(self):
+        """Return events other processes wrote since load() or the last call"""
+        return []
+
+    def scan(self):
+        """Stream (guild_id, user_id) pairs, grouped by guild, from one consistent view of the store
+
+        Meant for readers outside the bot, such as check_watchlist.py, that
+        must not hold a whole large watchlist in memory.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonStore(WatchlistStore):
+    """Watchlist storage: a JSON snapshot plus an append-only journal of changes
+
+    Every change is appended to the journal. Once the journal passes
+    compact_bytes the whole watchlist is written to a new snapshot and the
+    journal is moved aside as an audit segment (journal path + timestamp).
+    """
+
+    def __init__(self, snapshot_path, journal_path, compact_bytes=JOURNAL_COMPACT_BYTES, expiry_path=None):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.expiry_path = expiry_path or os.path.splitext(snapshot_path)[0] + ".expiries.json"
+        self.compact_bytes = compact_bytes
+        self._journal = None
+        self._journal_size = 0
+
+    def load(self):
+        """Load the snapshot and replay the journal on top of it"""
+        data = {
+            int(guild_id): {int(user_id) for user_id in user_ids}
+            for guild_id, user_ids in load_json_file(self.snapshot_path).items()
+            if user_ids
+        }
+        # Replaying events already in the snapshot is harmless, the last
+        # add/remove for a user always wins
+        for event in read_journal(self.journal_path):
+            apply_event(data, event)
+        return data
+
+    def append(self, events):
+        """Append a batch of events to the journal with a single fsync"""
+        if self._journal is None:
+            self._open_journal()
+        lines = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events).encode()
+        self._journal.write(lines)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._journal_size += len(lines)
+
+    def _open_journal(self):
+        self._journal = open(self.journal_path, "a+b")
+        size = self._journal.seek(0, os.SEEK_END)
+        if size:
+            # Drop a torn last line so new events don't get glued onto it
+            self._journal.seek(max(0, size - 4096))
+            tail = self._journal.read()
+            if not tail.endswith(b"\n"):
+                size -= len(tail) - (tail.rfind(b"\n") + 1)
+                self._journal.truncate(size)
+        self._journal_size = size
+
+    def needs_compaction(self):
+        return self._journal_size >= self.compact_bytes
+
+    def load_expiries(self):
+        """Load the expiry file and replay the journal on top of it"""
+        expiries = {}
+        try:
+            for guild_id, entries in load_json_file(self.expiry_path).items():
+                for user_id, expires_at in entries:
+                    expiries[(int(guild_id), int(user_id))] = int(expires_at)
+        except (TypeError, ValueError) as e:
+            raise WatchlistLoadError(f"Could not read {self.expiry_path}: unexpected layout") from e
+        for event in read_journal(self.journal_path):
+            apply_expiry(expiries, event)
+        return expiries
+
+    def compact(self, snapshot, expiries=None):
+        """Write a new snapshot and retire the journal it covers"""
+        # Expiries go first: if we stop before the snapshot, the old journal
+        # is still there and replays over them cleanly
+        if expiries is not None:
+            atomic_write_json(self.expiry_path, expiries)
+        atomic_write_json(self.snapshot_path, snapshot)
+        self.close()
+        # Keep the retired journal as part of the audit trail
+        os.replace(self.journal_path, f"{self.journal_path}.{time.time_ns()}")
+        self._journal_size = 0
+
+    def events(self):
+        """Yield every journaled event, retired segments first"""
+        segments = sorted(glob.glob(glob.escape(self.journal_path) + ".*"), key=_segment_key)
+        for path in segments + [self.journal_path]:
+            yield from read_journal(path)
+
+    def history(self, guild_id, user_id, limit=10):
+        matches = [event for event in self.events() if event["g"] == guild_id and event["u"] == user_id]
+        return matches[::-1][:limit]
+
+    def _open_files(self, attempts=5):
+        """Open the journal, then the snapshot, as one consistent pair
+
+        Compaction writes the new snapshot before retiring the journal, so a
+        journal opened first is always covered by (or newer than) the
+        snapshot opened after it. If the journal was retired in between,
+        open the pair again.
+        """
+        for _ in range(attempts):
+            try:
+                journal = open(self.journal_path)
+            except FileNotFoundError:
+                journal = None
+            try:
+                snapshot = open(self.snapshot_path)
+            except FileNotFoundError:
+                snapshot = None
+            except OSError as e:
+                if journal is not None:
+                    journal.close()
+                raise WatchlistLoadError(f"Could not read {self.snapshot_path}: {e}") from e
+            if journal is None:
+                return None, snapshot
+            try:
+                retired = os.stat(self.journal_path).st_ino != os.fstat(journal.fileno()).st_ino
+            except FileNotFoundError:
+                retired = True
+            if not retired:
+                return journal, snapshot
+            journal.close()
+            if snapshot is not None:
+                snapshot.close()
+        raise WatchlistLoadError(f"{self.journal_path} kept being compacted while reading, try again")
+
+    def scan(self):
+        journal, snapshot = self._open_files()
+        try:
+            # The journal is small (it is compacted past compact_bytes), keep its net effect in memory
+            added = {}
+            removed = set()
+            if journal is not None:
+                for event in _read_journal_lines(journal, self.journal_path):
+                    key = (event["g"], event["u"])
+                    if event["op"] == "add":
+                        added.setdefault(event["g"], set()).add(event["u"])
+                        removed.discard(key)
+                    elif event["op"] in REMOVE_OPS:
+                        added.get(event["g"], set()).discard(event["u"])
+                        removed.add(key)
+
+            current = None
+            if snapshot is not None:
+                for guild_id, user_id in iter_snapshot(snapshot, self.snapshot_path):
+                    if guild_id != current:
+                        # Users the journal added to the previous guild
+                        for extra in sorted(added.pop(current, ())):
+                            yield current, extra
+                        current = guild_id
+                    if (guild_id, user_id) in removed:
+                        continue
+                    added.get(guild_id, set()).discard(user_id)
+                    yield guild_id, user_id
+            for extra in sorted(added.pop(current, ())):
+                yield current, extra
+            # Guilds that only appear in the journal
+            for guild_id in sorted(added):
+                for user_id in sorted(added[guild_id]):
+                    yield guild_id, user_id
+        finally:
+            if journal is not None:
+                journal.close()
+            if snapshot is not None:
+                snapshot.close()
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+def _segment_key(path):
+    suffix = path.rsplit(".", 1)[-1]
+    return int(suffix) if suffix.isdigit() else 0
+
+
+def _row_event(op, guild_id, user_id, by, ts, expires_at):
+    event = {"op": op, "g": guild_id, "u": user_id, "by": by, "ts": ts}
+    if expires_at is not None:
+        event["exp"] = expires_at
+    return event
+
+
+class SqliteStore(WatchlistStore):
+    """Watchlist storage in an SQLite database running in WAL mode
+
+    WAL lets readers such as check_watchlist.py query while the bot is
+    writing without either side blocking. Events are tagged with the
+    process that wrote them, so bot processes sharing the database (one
+    per shard range) can pick up each other's changes through changes().
+    """
+
+    shared = True
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self._origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._last_event_id = 0
+        self._data_version = None
+        try:
+            if readonly:
+                uri = f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro"
+                self._db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            else:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                # With WAL, NORMAL only gives up durability of the last commits on power loss
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._create_schema()
+            self._db.execute("PRAGMA busy_timeout=5000")
+        except sqlite3.DatabaseError as e:
+            raise WatchlistLoadError(f"Could not open {path}: {e}") from e
+        # Writes come from the save loop, history from commands, one at a time
+        self._lock = threading.Lock()
+
+    def _create_schema(self):
+        with self._db:
+            # The primary key is the (guild_id, user_id) index, WITHOUT ROWID
+            # stores the rows in it directly
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS watchlist ("
+                "guild_id INTEGER NOT NULL, "
+                "user_id INTEGER NOT NULL, "
+                "PRIMARY KEY (guild_id, user_id)"
+                ") WITHOUT ROWID"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS watchlist_events ("
+                "id INTEGER PRIMARY KEY, "
+                "op TEXT NOT NULL, "
+                "guild_id INTEGER NOT NULL, "
+                "user_id INTEGER NOT NULL, "
+                "by INTEGER, "
+                "ts INTEGER NOT NULL, "
+                "origin TEXT"
+                ")"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(watchlist_events)")]
+            if "origin" not in columns:
+                # Databases created before multi-process support
+                self._db.execute("ALTER TABLE watchlist_events ADD COLUMN origin TEXT")
+            if "expires_at" not in columns:
+                # Databases created before time-bounded monitoring
+                self._db.execute("ALTER TABLE watchlist_events ADD COLUMN expires_at INTEGER")
+            # Only time-bounded entries have a row here
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS watchlist_expiries ("
+                "guild_id INTEGER NOT NULL, "
+                "user_id INTEGER NOT NULL, "
+                "expires_at INTEGER NOT NULL, "
+                "PRIMARY KEY (guild_id, user_id)"
+                ") WITHOUT ROWID"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS watchlist_events_guild_user "
+                "ON watchlist_events (guild_id, user_id)"
+            )
+
+    def load(self):
+        data = {}
+        with self._lock:
+            try:
+                # One read transaction so the rows and the event position agree
+                self._db.execute("BEGIN")
+                try:
+                    for guild_id, user_id in self._db.execute("SELECT guild_id, user_id FROM watchlist"):
+                        data.setdefault(guild_id, set()).add(user_id)
+                    self._last_event_id = self._db.execute(
+                        "SELECT COALESCE(MAX(id), 0) FROM watchlist_events"
+                    ).fetchone()[0]
+                finally:
+                    self._db.execute("COMMIT")
+            except sqlite3.DatabaseError as e:
+                raise WatchlistLoadError(f"Could not read {self.path}: {e}") from e
+        return data
+
+    def append(self, events):
+        with self._lock, self._db:
+            recorded = []
+            for event in events:
+                if event["op"] == "expire":
+                    # Every process sharing the database expires the same entries, only the
+                    # first one to get here still finds the expiry and records the event
+                    expired = self._db.execute(
+                        "DELETE FROM watchlist_expiries WHERE guild_id = ? AND user_id = ? AND expires_at <= ? RETURNING 1",
+                        (event["g"], event["u"], event["ts"]),
+                    ).fetchone()
+                    if expired is not None:
+                        self._db.execute(
+                            "DELETE FROM watchlist WHERE guild_id = ? AND user_id = ?",
+                            (event["g"], event["u"]),
+                        )
+                        recorded.append(event)
+                    continue
+                recorded.append(event)
+                if event["op"] == "add":
+                    self._db.execute(
+                        "INSERT OR IGNORE INTO watchlist (guild_id, user_id) VALUES (?, ?)",
+                        (event["g"], event["u"]),
+                    )
+                else:
+                    self._db.execute(
+                        "DELETE FROM watchlist WHERE guild_id = ? AND user_id = ?",
+                        (event["g"], event["u"]),
+                    )
+                if event["op"] == "add" and event.get("exp") is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO watchlist_expiries (guild_id, user_id, expires_at) VALUES (?, ?, ?)",
+                        (event["g"], event["u"], event["exp"]),
+                    )
+                else:
+                    self._db.execute(
+                        "DELETE FROM watchlist_expiries WHERE guild_id = ? AND user_id = ?",
+                        (event["g"], event["u"]),
+                    )
+            self._db.executemany(
+                "INSERT INTO watchlist_events (op, guild_id, user_id, by, ts, origin, expires_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(e["op"], e["g"], e["u"], e["by"], e["ts"], self._origin, e.get("exp")) for e in recorded],
+            )
+
+    def load_expiries(self):
+        with self._lock:
+            try:
+                rows = self._db.execute("SELECT guild_id, user_id, expires_at FROM watchlist_expiries").fetchall()
+            except sqlite3.DatabaseError as e:
+                raise WatchlistLoadError(f"Could not read {self.path}: {e}") from e
+        return {(guild_id, user_id): expires_at for guild_id, user_id, expires_at in rows}
+
+    def import_watchlist(self, data, history=(), expiries=None):
+        """Bulk load a {guild_id: set(user_id)} watchlist, its expiries and past events in one transaction"""
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO watchlist (guild_id, user_id) VALUES (?, ?)",
+                [(guild_id, user_id) for guild_id, user_ids in data.items() for user_id in user_ids],
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO watchlist_expiries (guild_id, user_id, expires_at) VALUES (?, ?, ?)",
+                [(guild_id, user_id, expires_at) for (guild_id, user_id), expires_at in (expiries or {}).items()],
+            )
+            self._db.executemany(
+                "INSERT INTO watchlist_events (op, guild_id, user_id, by, ts, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(e["op"], e["g"], e["u"], e.get("by"), e["ts"], e.get("exp")) for e in history],
+            )
+
+    def history(self, guild_id, user_id, limit=10):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT op, guild_id, user_id, by, ts, expires_at FROM watchlist_events "
+                "WHERE guild_id = ? AND user_id = ? ORDER BY id DESC LIMIT ?",
+                (guild_id, user_id, limit),
+            ).fetchall()
+        return [_row_event(op, g, u, by, ts, exp) for op, g, u, by, ts, exp in rows]
+
+    def scan(self):
+        # A single statement reads one WAL snapshot, concurrent writes don't show up halfway.
+        # Rows are fetched in batches so the lock isn't held while the caller works.
+        try:
+            with self._lock:
+                cursor = self._db.execute("SELECT guild_id, user_id FROM watchlist ORDER BY guild_id, user_id")
+            while True:
+                with self._lock:
+                    rows = cursor.fetchmany(1000)
+                if not rows:
+                    return
+                yield from rows
+        except sqlite3.DatabaseError as e:
+            raise WatchlistLoadError(f"Could not read {self.path}: {e}") from e
+
+    def changes(self):
+        with self._lock:
+            # data_version only moves when another connection commits, so idle polls are cheap
+            data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return []
+            self._data_version = data_version
+            rows = self._db.execute(
+                "SELECT id, op, guild_id, user_id, by, ts, expires_at, origin FROM watchlist_events "
+                "WHERE id > ? ORDER BY id",
+                (self._last_event_id,),
+            ).fetchall()
+        if rows:
+            self._last_event_id = rows[-1][0]
+        return [
+            _row_event(op, g, u, by, ts, exp)
+            for _, op, g, u, by, ts, exp, origin in rows
+            if origin != self._origin
+        ]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import discord
+
+from rest_scheduler import BACKGROUND
+
+# Name of the channel monitored messages are logged to
+TRACKED_CHANNEL_NAME = "tracked-users"
+
+# Seconds to wait before trying to create the channel again after a failure
+CREATE_RETRY_DELAY = 300
+
+
+class TrackedChannelCache:
+    """Per-guild cache of the #tracked-users channel ID
+
+    Entries are dropped by the on_guild_channel_* events, so a hit never
+    needs to scan guild.text_channels.
+    """
+
+    def __init__(self, scheduler=None):
+        self._scheduler = scheduler
+        # guild_id -> tracked-users channel ID
+        self._channel_ids = {}
+        # guild_id -> time the channel could last not be created
+        self._failed_at = {}
+        # guild_id -> lock so only one lookup/creation runs per guild
+        self._locks = {}
+
+    async def get(self, guild):
+        """Return the guild's tracked-users channel, creating it if needed (None if impossible)"""
+        channel = self._cached(guild)
+        if channel is not None:
+            return channel
+
+        lock = self._locks.get(guild.id)
+        if lock is None:
+            lock = self._locks[guild.id] = asyncio.Lock()
+
+        async with lock:
+            # Another message may have found or created it while we waited
+            channel = self._cached(guild)
+            if channel is not None:
+                return channel
+
+            failed_at = self._failed_at.get(guild.id)
+            if failed_at is not None and time.monotonic() - failed_at < CREATE_RETRY_DELAY:
+                return None
+
+            channel = discord.utils.get(guild.text_channels, name=TRACKED_CHANNEL_NAME)
+            if channel is None:
+                # Try to create the channel if it doesn't exist
+                options = {
+                    "name": TRACKED_CHANNEL_NAME,
+                    "topic": "Logs for monitored user messages",
+                    "reason": "Auto-created by user tracking bot",
+                }
+                try:
+                    if self._scheduler is not None:
+                        # Log traffic, waits behind command replies (SchedulerBusy reaches the caller)
+                        channel = await self._scheduler.run(BACKGROUND, "POST", f"/guilds/{guild.id}/channels", guild.create_text_channel, **options)
+                    else:
+                        channel = await guild.create_text_channel(**options)
+                except discord.Forbidden:
+                    print(f"Missing permissions to create tracked-users channel in {guild.name}")
+                    self._failed_at[guild.id] = time.monotonic()
+                    return None
+
+            self._failed_at.pop(guild.id, None)
+            self._channel_ids[guild.id] = channel.id
+            return channel
+
+    def _cached(self, guild):
+        channel_id = self._channel_ids.get(guild.id)
+        if channel_id is None:
+            return None
+        return guild.get_channel(channel_id)
+
+    def invalidate(self, guild_id):
+        """Forget what is known about a guild's tracked-users channel"""
+        self._channel_ids.pop(guild_id, None)
+        self._failed_at.pop(guild_id, None)
+
+    def channel_created(self, channel):
+        if channel.name == TRACKED_CHANNEL_NAME:
+            self.invalidate(channel.guild.id)
+
+    def channel_deleted(self, channel):
+        if self._channel_ids.get(channel.guild.id) == channel.id:
+            self.invalidate(channel.guild.id)
+
+    def channel_updated(self, before, after):
+        # Renamed to or away from tracked-users
+        if before.name != after.name and TRACKED_CHANNEL_NAME in (before.name, after.name):
+            self.invalidate(after.guild.id)
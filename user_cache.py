@@ -0,0 +1,109 @@
+import asyncio
+import collections
+import time
+
+import discord
+
+import metrics
+from rest_scheduler import BULK, INTERACTIVE, SchedulerBusy
+
+# Fetched users kept in memory, least recently used are evicted first
+USER_CACHE_SIZE = 10000
+# Seconds a fetched user (or a "no such user" answer) stays cached
+USER_CACHE_TTL = 3600
+# REST fetches allowed in flight at once
+FETCH_CONCURRENCY = 5
+
+USER_LOOKUPS = metrics.counter("tracker_user_lookups_total", "User lookups by where they were answered", ["source"])
+USER_FETCHES = metrics.counter("tracker_fetch_user_total", "fetch_user calls by result", ["result"])
+USER_FETCH_SECONDS = metrics.histogram("tracker_fetch_user_seconds", "fetch_user latency, including the wait for a free fetch slot")
+
+
+class UserResolver:
+    """Resolve user IDs to users, going to the REST API only as a last resort
+
+    Lookups try the gateway cache (bot.get_user, guild.get_member) first,
+    then a TTL/LRU cache of earlier fetches, and only then fetch_user with
+    bounded concurrency. Deleted accounts are cached too, as None.
+    Fetches wait their turn in the scheduler lane the caller asks for.
+    """
+
+    def __init__(self, bot, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL, concurrency=FETCH_CONCURRENCY, scheduler=None):
+        self._bot = bot
+        self._scheduler = scheduler
+        self._max_size = max_size
+        self._ttl = ttl
+        # user_id -> (expires_at, user or None)
+        self._cache = collections.OrderedDict()
+        # user_id -> task already fetching that user
+        self._inflight = {}
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.gateway_hits = 0
+        self.cache_hits = 0
+        self.fetches = 0
+
+    async def resolve(self, user_id, guild=None, lane=INTERACTIVE):
+        """Return the user (or guild member) for an ID, None if it doesn't exist or can't be fetched"""
+        user = self._bot.get_user(user_id)
+        if user is None and guild is not None:
+            user = guild.get_member(user_id)
+        if user is not None:
+            self.gateway_hits += 1
+            USER_LOOKUPS.labels("gateway").inc()
+            return user
+
+        entry = self._cache.get(user_id)
+        if entry is not None:
+            expires_at, user = entry
+            if expires_at > time.monotonic():
+                self._cache.move_to_end(user_id)
+                self.cache_hits += 1
+                USER_LOOKUPS.labels("cache").inc()
+                return user
+            del self._cache[user_id]
+
+        # Share one REST call between concurrent lookups of the same user
+        USER_LOOKUPS.labels("fetch").inc()
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = self._inflight[user_id] = asyncio.get_running_loop().create_task(self._fetch(user_id, lane))
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    async def resolve_many(self, user_ids, guild=None, lane=BULK):
+        """Resolve several IDs at once, returns users (or None) in the same order"""
+        return await asyncio.gather(*(self.resolve(user_id, guild, lane) for user_id in user_ids))
+
+    async def _fetch(self, user_id, lane):
+        started = time.perf_counter()
+        async with self._semaphore:
+            self.fetches += 1
+            try:
+                if self._scheduler is not None:
+                    user = await self._scheduler.run(lane, "GET", f"/users/{user_id}", self._bot.fetch_user, user_id)
+                else:
+                    user = await self._bot.fetch_user(user_id)
+            except discord.NotFound:
+                # Deleted account, remember that too
+                user = None
+                USER_FETCHES.labels("not_found").inc()
+            except discord.HTTPException:
+                # Don't cache transient failures
+                USER_FETCHES.labels("error").inc()
+                return None
+            except SchedulerBusy:
+                # Shed under load, the caller shows the bare ID instead
+                USER_FETCHES.labels("shed").inc()
+                return None
+            else:
+                USER_FETCHES.labels("ok").inc()
+            finally:
+                USER_FETCH_SECONDS.observe(time.perf_counter() - started)
+        self._store(user_id, user)
+        return user
+
+    def _store(self, user_id, user):
+        self._cache[user_id] = (time.monotonic() + self._ttl, user)
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self._max_size:
+            self._cache.popitem(last=False)
@@ -0,0 +1,442 @@
+import asyncio
+import collections
+import os
+import sqlite3
+import threading
+import time
+
+from storage import WatchlistLoadError, atomic_write_json, load_json_file
+from watchlist import SYNC_INTERVAL
+
+try:
+    # Regex rules run on the event loop for every message in the guild, so they use
+    # RE2: matching time is linear in the text whatever the pattern (pip install google-re2)
+    import re2
+except ImportError:
+    re2 = None
+
+# Per-guild keyword and regex rules that flag messages from anyone
+WATCH_RULES_FILE = os.getenv("WATCH_RULES_FILE", "watch_rules.json")
+
+# Limits per guild, so one server can't make every message slow to check
+MAX_RULES_PER_GUILD = 500
+MAX_PATTERN_LENGTH = 200
+# Characters of a message the regex rules look at
+MAX_MATCH_CHARS = 4000
+
+# Rule kinds: case-insensitive text anywhere in the message, or a regular expression
+WORD = "word"
+REGEX = "regex"
+
+if re2 is not None:
+    _RE2_OPTIONS = re2.Options()
+    _RE2_OPTIONS.case_sensitive = False
+    # Bad patterns are reported to the moderator, not logged by RE2 itself
+    _RE2_OPTIONS.log_errors = False
+    # A guild's regex rules share one automaton; the default 8 MB can't hold 500 of them
+    _RE2_OPTIONS.max_mem = 32 * 1024 * 1024
+
+
+class LiteralMatcher:
+    """Aho-Corasick automaton: finds every literal in a text in one pass over it"""
+
+    def __init__(self, literals):
+        # literals: (lowercased text, rule ID) pairs
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for text, rule_id in literals:
+            state = 0
+            for char in text:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                    self._goto[state][char] = next_state
+                state = next_state
+            self._output[state] += (rule_id,)
+
+        # Failure links breadth-first; a state also reports whatever its failure state reports
+        pending = collections.deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def search(self, text):
+        """Return the rule IDs of every literal in text (text must be lowercased)"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class PatternMatcher:
+    """Regex rules compiled into one RE2 set, which reports every rule a text matches in one pass"""
+
+    def __init__(self, patterns):
+        # patterns: (pattern, rule ID) pairs
+        self._set = re2.Set.SearchSet(_RE2_OPTIONS)
+        # Set index -> rule ID
+        self._rule_ids = []
+        for pattern, rule_id in patterns:
+            self._set.Add(pattern)
+            self._rule_ids.append(rule_id)
+        try:
+            self._set.Compile()
+        except re2.error as e:
+            raise ValueError("This server's regex rules are too large to check together") from e
+
+    def search(self, text):
+        """Return the rule IDs of every pattern found in text"""
+        return {self._rule_ids[index] for index in self._set.Match(text) or ()}
+
+
+def validate_regex(pattern):
+    """Raise ValueError if a pattern can't be used as a regex rule"""
+    if re2 is None:
+        raise ValueError("Regex rules need the google-re2 package, which isn't installed")
+    try:
+        compiled = re2.compile(pattern, _RE2_OPTIONS)
+    except re2.error as e:
+        reason = e.args[0].decode(errors="replace") if e.args and isinstance(e.args[0], bytes) else e
+        raise ValueError(f"Invalid regular expression: {reason}") from e
+    if compiled.match(""):
+        raise ValueError("Pattern matches every message")
+
+
+class GuildMatcher:
+    """One guild's rules compiled into a literal automaton and a regex set"""
+
+    def __init__(self, rules):
+        self.rules = {rule["id"]: rule for rule in rules}
+        self.literals = None
+        self.regex = None
+        self.compile(WORD)
+        self.compile(REGEX)
+
+    def compile(self, kind):
+        """Rebuild the matcher of one rule kind, the other one is left alone"""
+        rules = [rule for rule in self.rules.values() if rule["kind"] == kind]
+        if kind == WORD:
+            self.literals = LiteralMatcher((rule["pattern"].lower(), rule["id"]) for rule in rules) if rules else None
+        else:
+            self.regex = PatternMatcher((rule["pattern"], rule["id"]) for rule in rules) if rules else None
+
+    def match(self, text):
+        found = self.literals.search(text.lower()) if self.literals else set()
+        if self.regex:
+            found |= self.regex.search(text[:MAX_MATCH_CHARS])
+        return [self.rules[rule_id] for rule_id in sorted(found)]
+
+
+def usable_rules(guild_id, rules):
+    """Return the rules of a guild that can be compiled, reporting the others"""
+    usable = []
+    for rule in rules:
+        try:
+            if not isinstance(rule["id"], int) or rule["kind"] not in (WORD, REGEX):
+                raise ValueError("unexpected layout")
+            if rule["kind"] == REGEX:
+                validate_regex(rule["pattern"])
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Skipping watch rule {rule!r:.100} of guild {guild_id}: {e}")
+            continue
+        usable.append(rule)
+    return usable
+
+
+class JsonRuleStore:
+    """Watch rules in WATCH_RULES_FILE, rewritten whole on every change
+
+    Methods are blocking and are called from worker threads.
+    """
+
+    shared = False
+
+    def __init__(self, path=WATCH_RULES_FILE):
+        self.path = path
+        # guild_id -> list of rules, oldest first
+        self._rules = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Return {guild_id: [rule, ...]} (raises WatchlistLoadError if the file can't be read)"""
+        with self._lock:
+            self._rules = {}
+            for guild_id, rules in load_json_file(self.path).items():
+                usable = usable_rules(guild_id, rules)
+                if usable:
+                    self._rules[int(guild_id)] = usable
+            return {guild_id: list(rules) for guild_id, rules in self._rules.items()}
+
+    def add(self, guild_id, kind, pattern, by=None):
+        """Save a new rule and return it with its ID"""
+        with self._lock:
+            rules = self._rules.setdefault(guild_id, [])
+            rule_id = max((rule["id"] for rule in rules), default=0) + 1
+            rule = {"id": rule_id, "kind": kind, "pattern": pattern, "by": by, "ts": int(time.time())}
+            rules.append(rule)
+            self._write()
+        return rule
+
+    def remove(self, guild_id, rule_id):
+        """Delete a rule, returns it or None if the guild has no such rule"""
+        with self._lock:
+            rules = self._rules.get(guild_id, [])
+            for rule in rules:
+                if rule["id"] == rule_id:
+                    break
+            else:
+                return None
+            rules.remove(rule)
+            if not rules:
+                del self._rules[guild_id]
+            self._write()
+        return rule
+
+    def _write(self):
+        atomic_write_json(self.path, {str(guild_id): rules for guild_id, rules in self._rules.items()})
+
+    def changes(self):
+        """Only this process writes the file, so there is never anything new"""
+        return None
+
+    def close(self):
+        pass
+
+
+class SqliteRuleStore:
+    """Watch rules in the shared SQLite watchlist database
+
+    Used when several bot processes share one database (one per shard
+    range): rule IDs are handed out by the database, and changes() lets
+    each process pick up the rules the others added or removed.
+    """
+
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self._data_version = None
+        try:
+            # The watchlist store already put the database in WAL mode
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA busy_timeout=5000")
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS watch_rules ("
+                    "guild_id INTEGER NOT NULL, "
+                    "rule_id INTEGER NOT NULL, "
+                    "kind TEXT NOT NULL, "
+                    "pattern TEXT NOT NULL, "
+                    "by INTEGER, "
+                    "ts INTEGER NOT NULL, "
+                    "PRIMARY KEY (guild_id, rule_id)"
+                    ") WITHOUT ROWID"
+                )
+        except sqlite3.DatabaseError as e:
+            raise WatchlistLoadError(f"Could not open {path}: {e}") from e
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Return {guild_id: [rule, ...]} (raises WatchlistLoadError if the table can't be read)"""
+        with self._lock:
+            try:
+                self._data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+                rows = self._db.execute(
+                    "SELECT guild_id, rule_id, kind, pattern, by, ts FROM watch_rules ORDER BY guild_id, rule_id"
+                ).fetchall()
+            except sqlite3.DatabaseError as e:
+                raise WatchlistLoadError(f"Could not read {self.path}: {e}") from e
+        data = {}
+        for guild_id, rule_id, kind, pattern, by, ts in rows:
+            data.setdefault(guild_id, []).append({"id": rule_id, "kind": kind, "pattern": pattern, "by": by, "ts": ts})
+        return {guild_id: usable for guild_id, rules in data.items() if (usable := usable_rules(guild_id, rules))}
+
+    def add(self, guild_id, kind, pattern, by=None):
+        """Save a new rule and return it with its ID"""
+        ts = int(time.time())
+        with self._lock, self._db:
+            # The ID is picked inside the insert, so two processes can't both take it
+            rule_id = self._db.execute(
+                "INSERT INTO watch_rules (guild_id, rule_id, kind, pattern, by, ts) "
+                "SELECT ?, COALESCE(MAX(rule_id), 0) + 1, ?, ?, ?, ? FROM watch_rules WHERE guild_id = ? "
+                "RETURNING rule_id",
+                (guild_id, kind, pattern, by, ts, guild_id),
+            ).fetchone()[0]
+            # Our own commits don't move data_version, reload on the next poll so
+            # a poll that raced this insert can't leave the rule out for good
+            self._data_version = None
+        return {"id": rule_id, "kind": kind, "pattern": pattern, "by": by, "ts": ts}
+
+    def remove(self, guild_id, rule_id):
+        """Delete a rule, returns it or None if the guild has no such rule"""
+        with self._lock, self._db:
+            row = self._db.execute(
+                "DELETE FROM watch_rules WHERE guild_id = ? AND rule_id = ? RETURNING kind, pattern, by, ts",
+                (guild_id, rule_id),
+            ).fetchone()
+            self._data_version = None
+        if row is None:
+            return None
+        kind, pattern, by, ts = row
+        return {"id": rule_id, "kind": kind, "pattern": pattern, "by": by, "ts": ts}
+
+    def import_rules(self, data):
+        """Bulk load a {guild_id: [rule, ...]} set of rules keeping their IDs, in one transaction"""
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO watch_rules (guild_id, rule_id, kind, pattern, by, ts) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (guild_id, rule["id"], rule["kind"], rule["pattern"], rule.get("by"), rule.get("ts", 0))
+                    for guild_id, rules in data.items() for rule in rules
+                ],
+            )
+
+    def changes(self):
+        """Return every rule if any process committed to the database since the last call, else None"""
+        with self._lock:
+            # data_version only moves when another connection commits, so idle polls are cheap
+            if self._db.execute("PRAGMA data_version").fetchone()[0] == self._data_version:
+                return None
+        return self.load()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class WatchRules:
+    """Watch rules of every guild, checked against each message in guilds that have any
+
+    Rules live in memory, every change is written to the rule store first.
+    A change only recompiles the matcher of the affected guild and rule
+    kind.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        # guild_id -> GuildMatcher
+        self._guilds = {}
+        # Guilds with at least one rule, for on_message's fast reject.
+        # Always updated in place so callers can hold on to it.
+        self.guilds = set()
+        self._sync_task = None
+
+    @classmethod
+    def load(cls, store):
+        """Load every rule from the store (raises WatchlistLoadError if it can't be read)"""
+        watch_rules = cls(store)
+        watch_rules.apply_remote(store.load())
+        return watch_rules
+
+    def match(self, guild_id, text):
+        """Return the rules a message's text matches, oldest first"""
+        matcher = self._guilds.get(guild_id)
+        if matcher is None or not text:
+            return []
+        return matcher.match(text)
+
+    def rules(self, guild_id):
+        """Return a guild's rules, oldest first"""
+        matcher = self._guilds.get(guild_id)
+        return [matcher.rules[rule_id] for rule_id in sorted(matcher.rules)] if matcher else []
+
+    async def add(self, guild_id, kind, pattern, by=None):
+        """Save a rule and recompile the guild's matcher, returns the new rule
+
+        Raises ValueError for an unusable pattern or a guild at its limit.
+        """
+        pattern = pattern.strip()
+        if not pattern:
+            raise ValueError("The pattern is empty")
+        if len(pattern) > MAX_PATTERN_LENGTH:
+            raise ValueError(f"Patterns can be at most {MAX_PATTERN_LENGTH} characters")
+        if kind == REGEX:
+            validate_regex(pattern)
+        matcher = self._guilds.get(guild_id)
+        if matcher is not None:
+            if len(matcher.rules) >= MAX_RULES_PER_GUILD:
+                raise ValueError(f"This server already has {MAX_RULES_PER_GUILD} watch rules")
+            for rule in matcher.rules.values():
+                if rule["kind"] == kind and rule["pattern"].lower() == pattern.lower():
+                    raise ValueError(f"Rule #{rule['id']} already watches for this")
+            if kind == REGEX:
+                # Raises before anything is saved if the guild's set would get too large
+                PatternMatcher([(rule["pattern"], rule["id"]) for rule in matcher.rules.values() if rule["kind"] == REGEX] + [(pattern, 0)])
+
+        rule = await asyncio.to_thread(self._store.add, guild_id, kind, pattern, by)
+        matcher = self._guilds.get(guild_id)
+        if matcher is None:
+            self._guilds[guild_id] = GuildMatcher([rule])
+            self.guilds.add(guild_id)
+        else:
+            matcher.rules[rule["id"]] = rule
+            matcher.compile(kind)
+        return rule
+
+    async def remove(self, guild_id, rule_id):
+        """Delete a rule, returns it or None if the guild has no such rule"""
+        rule = await asyncio.to_thread(self._store.remove, guild_id, rule_id)
+        matcher = self._guilds.get(guild_id)
+        if rule is None or matcher is None or matcher.rules.pop(rule_id, None) is None:
+            return rule
+        if matcher.rules:
+            matcher.compile(rule["kind"])
+        else:
+            del self._guilds[guild_id]
+            self.guilds.discard(guild_id)
+        return rule
+
+    def apply_remote(self, data):
+        """Switch to a full {guild_id: [rule, ...]} set of rules, recompiling only guilds that changed"""
+        for guild_id in [guild_id for guild_id in self._guilds if guild_id not in data]:
+            del self._guilds[guild_id]
+            self.guilds.discard(guild_id)
+        for guild_id, rules in data.items():
+            matcher = self._guilds.get(guild_id)
+            if matcher is None or matcher.rules != {rule["id"]: rule for rule in rules}:
+                try:
+                    self._guilds[guild_id] = GuildMatcher(rules)
+                except ValueError as e:
+                    print(f"Skipping the regex rules of guild {guild_id}: {e}")
+                    self._guilds[guild_id] = GuildMatcher([rule for rule in rules if rule["kind"] != REGEX])
+                self.guilds.add(guild_id)
+
+    def start_sync(self, interval=SYNC_INTERVAL):
+        """Keep up with other processes writing to a shared store (no-op otherwise)"""
+        if self._store.shared and self._sync_task is None:
+            self._sync_task = asyncio.get_running_loop().create_task(self._sync_loop(interval))
+
+    async def _sync_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                data = await asyncio.to_thread(self._store.changes)
+                if data is not None:
+                    self.apply_remote(data)
+            except Exception as e:
+                print(f"Error syncing watch rule changes: {e}")
+
+    def close(self):
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+        self._store.close()
@@ -0,0 +1,355 @@
+import asyncio
+import heapq
+import time
+
+import metrics
+from storage import REMOVE_OPS, make_event
+
+# Seconds to wait for more changes before writing them out together
+SAVE_DELAY = 0.5
+
+# Seconds between checks for changes made by other bot processes (shared stores only)
+SYNC_INTERVAL = 2.0
+
+# Expired users removed per batch (one store write each), and the longest the
+# expiry task sleeps before checking the wall clock again
+EXPIRY_BATCH_SIZE = 500
+EXPIRY_MAX_SLEEP = 3600
+
+# Seconds an expired entry of a guild served by another bot process is left to
+# that process, before this one removes it anyway (shared stores only)
+EXPIRY_GRACE = 60
+
+PERSIST_WRITES = metrics.counter("tracker_persistence_writes_total", "Watchlist store writes by operation and result", ["op", "result"])
+PERSIST_SECONDS = metrics.histogram("tracker_persistence_write_seconds", "Watchlist store write latency", ["op"])
+EXPIRED = metrics.counter("tracker_watchlist_expired_total", "Users removed from the watchlist because their monitoring period ended")
+
+
+class Watchlist:
+    """In-memory index of monitored users, keyed by guild ID"""
+
+    def __init__(self, store, save_delay=SAVE_DELAY):
+        # guild_id (int) -> set of monitored user IDs (int)
+        self._guilds = {}
+        # Every user monitored in at least one guild, for on_message's fast reject.
+        # Always updated in place so callers can hold on to it.
+        self.watched_users = set()
+        # user_id -> number of guilds monitoring them
+        self._guild_counts = {}
+        self._store = store
+        self._save_delay = save_delay
+        # Journal events not yet handed to the store
+        self._pending = []
+        self._save_task = None
+        self._flush_requested = asyncio.Event()
+        self._sync_task = None
+        # Called as listener(op, guild_id, user_id) after every change
+        self._listeners = []
+        # (guild_id, user_id) -> unix time monitoring ends, for time-bounded entries only
+        self._expiries = {}
+        # (due_at, expires_at, guild_id, user_id), earliest first. due_at is
+        # expires_at unless the entry was left to another process. Entries whose
+        # expiry changed since are skipped when they come up, not searched for.
+        self._expiry_heap = []
+        self._expiry_changed = asyncio.Event()
+        self._expiry_task = None
+        self._serves = None
+
+    @classmethod
+    def load(cls, store, save_delay=SAVE_DELAY):
+        """Build the index from everything the store has persisted"""
+        watchlist = cls(store, save_delay)
+        watchlist._guilds = store.load()
+        for users in watchlist._guilds.values():
+            for user_id in users:
+                watchlist._watch(user_id)
+        # Entries that ran out while the bot was down go on the first expiry pass
+        watchlist._expiries = {
+            (guild_id, user_id): expires_at
+            for (guild_id, user_id), expires_at in store.load_expiries().items()
+            if watchlist.is_monitored(guild_id, user_id)
+        }
+        watchlist._rebuild_expiry_heap()
+        return watchlist
+
+    def to_dict(self):
+        """Return a snapshot in the on-disk {"guild_id": ["user_id", ...]} layout"""
+        return {
+            str(guild_id): [str(user_id) for user_id in sorted(users)]
+            for guild_id, users in self._guilds.items()
+            if users
+        }
+
+    def is_monitored(self, guild_id, user_id):
+        """Check if a user is monitored in a guild (no I/O)"""
+        users = self._guilds.get(guild_id)
+        return users is not None and user_id in users
+
+    def members(self, guild_id):
+        """Return the monitored user IDs of a guild, oldest accounts first"""
+        return sorted(self._guilds.get(guild_id, ()))
+
+    def count(self, guild_id):
+        """Return the number of monitored users in a guild"""
+        return len(self._guilds.get(guild_id, ()))
+
+    def add(self, guild_id, user_id, by=None, expires_at=None):
+        """Start monitoring a user (until expires_at if given), returns False if they were already monitored"""
+        users = self._guilds.setdefault(guild_id, set())
+        if user_id in users:
+            return False
+        users.add(user_id)
+        self._watch(user_id)
+        if expires_at is not None:
+            self._set_expiry(guild_id, user_id, expires_at)
+        self._record(make_event("add", guild_id, user_id, by, expires_at))
+        self._notify("add", guild_id, user_id)
+        return True
+
+    def set_expiry(self, guild_id, user_id, expires_at, by=None):
+        """Change when a monitored user's monitoring ends (None: never), returns False if nothing changed"""
+        if not self.is_monitored(guild_id, user_id) or self._expiries.get((guild_id, user_id)) == expires_at:
+            return False
+        self._set_expiry(guild_id, user_id, expires_at)
+        self._record(make_event("add", guild_id, user_id, by, expires_at))
+        return True
+
+    def expires_at(self, guild_id, user_id):
+        """Return when a user's monitoring ends, None if it doesn't"""
+        return self._expiries.get((guild_id, user_id))
+
+    def guild_expiries(self, guild_id):
+        """Return {user_id: expires_at} of a guild's time-bounded entries"""
+        return {user_id: expires_at for (g, user_id), expires_at in self._expiries.items() if g == guild_id}
+
+    def remove(self, guild_id, user_id, by=None):
+        """Stop monitoring a user, returns False if they were not monitored"""
+        return self._remove(guild_id, user_id, make_event("remove", guild_id, user_id, by))
+
+    def _remove(self, guild_id, user_id, event):
+        users = self._guilds.get(guild_id)
+        if not users or user_id not in users:
+            return False
+        users.discard(user_id)
+        if not users:
+            del self._guilds[guild_id]
+        self._unwatch(user_id)
+        self._expiries.pop((guild_id, user_id), None)
+        self._record(event)
+        self._notify("remove", guild_id, user_id)
+        return True
+
+    def _set_expiry(self, guild_id, user_id, expires_at):
+        key = (guild_id, user_id)
+        if expires_at is None:
+            self._expiries.pop(key, None)
+            return
+        self._expiries[key] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, expires_at, guild_id, user_id))
+        if self._expiry_heap[0][0] == expires_at:
+            # Sooner than whatever the expiry task is sleeping until
+            self._expiry_changed.set()
+
+    def add_listener(self, listener):
+        """Call listener(op, guild_id, user_id) whenever a user is added or removed"""
+        self._listeners.append(listener)
+
+    def _notify(self, op, guild_id, user_id):
+        for listener in self._listeners:
+            try:
+                listener(op, guild_id, user_id)
+            except Exception as e:
+                print(f"Error in watchlist listener: {e}")
+
+    def _watch(self, user_id):
+        count = self._guild_counts.get(user_id, 0)
+        self._guild_counts[user_id] = count + 1
+        if not count:
+            self.watched_users.add(user_id)
+
+    def _unwatch(self, user_id):
+        count = self._guild_counts[user_id] - 1
+        if count:
+            self._guild_counts[user_id] = count
+        else:
+            del self._guild_counts[user_id]
+            self.watched_users.discard(user_id)
+
+    def add_many(self, guild_id, user_ids, by=None):
+        """Start monitoring several users as one batch, returns the IDs that were newly added"""
+        return [user_id for user_id in user_ids if self.add(guild_id, user_id, by)]
+
+    def remove_many(self, guild_id, user_ids, by=None):
+        """Stop monitoring several users as one batch, returns the IDs that were removed"""
+        return [user_id for user_id in user_ids if self.remove(guild_id, user_id, by)]
+
+    def apply_remote(self, events):
+        """Apply changes another process already persisted, without writing them again"""
+        for event in events:
+            guild_id, user_id = event["g"], event["u"]
+            users = self._guilds.setdefault(guild_id, set())
+            if event["op"] == "add":
+                if user_id not in users:
+                    users.add(user_id)
+                    self._watch(user_id)
+                    self._notify("add", guild_id, user_id)
+                if self._expiries.get((guild_id, user_id)) != event.get("exp"):
+                    self._set_expiry(guild_id, user_id, event.get("exp"))
+            elif event["op"] in REMOVE_OPS and user_id in users:
+                users.discard(user_id)
+                self._unwatch(user_id)
+                self._expiries.pop((guild_id, user_id), None)
+                self._notify("remove", guild_id, user_id)
+            if not users:
+                del self._guilds[guild_id]
+
+    def start_sync(self, interval=SYNC_INTERVAL):
+        """Keep up with other processes writing to a shared store (no-op otherwise)"""
+        if self._store.shared and self._sync_task is None:
+            self._sync_task = asyncio.get_running_loop().create_task(self._sync_loop(interval))
+
+    async def _sync_loop(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.apply_remote(await asyncio.to_thread(self._store.changes))
+            except Exception as e:
+                print(f"Error syncing watchlist changes: {e}")
+
+    def start_expiry(self, serves=None):
+        """Start the task that removes users whose monitoring period ended
+
+        With a store shared by several processes, serves(guild_id) tells if
+        this process runs the guild's shard. Other guilds are left to their
+        own process for EXPIRY_GRACE seconds, so each entry is removed once.
+        """
+        if self._expiry_task is None:
+            self._serves = serves if self._store.shared else None
+            self._expiry_task = asyncio.get_running_loop().create_task(self._expiry_loop())
+
+    def _rebuild_expiry_heap(self):
+        self._expiry_heap = [
+            (expires_at, expires_at, guild_id, user_id)
+            for (guild_id, user_id), expires_at in self._expiries.items()
+        ]
+        heapq.heapify(self._expiry_heap)
+
+    async def _expiry_loop(self):
+        # One task for every expiry: sleep until the earliest one, purge what is due, repeat
+        while True:
+            now = time.time()
+            due = []
+            deferred = []
+            while self._expiry_heap and self._expiry_heap[0][0] <= now and len(due) < EXPIRY_BATCH_SIZE:
+                due_at, expires_at, guild_id, user_id = heapq.heappop(self._expiry_heap)
+                if self._expiries.get((guild_id, user_id)) != expires_at:
+                    continue
+                if due_at == expires_at and self._serves is not None and not self._serves(guild_id):
+                    # Its own process removes it and apply_remote() drops it here
+                    deferred.append((expires_at + EXPIRY_GRACE, expires_at, guild_id, user_id))
+                else:
+                    due.append((guild_id, user_id))
+            for entry in deferred:
+                heapq.heappush(self._expiry_heap, entry)
+            if due:
+                try:
+                    self.purge(due)
+                except Exception as e:
+                    print(f"Error removing expired watchlist entries: {e}")
+                # Let the batch's write start before looking at the next one
+                await asyncio.sleep(0)
+                continue
+
+            if len(self._expiry_heap) > 2 * len(self._expiries) + 64:
+                # Mostly stale entries from changed or removed expiries, rebuild
+                self._rebuild_expiry_heap()
+            timeout = min(self._expiry_heap[0][0] - now, EXPIRY_MAX_SLEEP) if self._expiry_heap else None
+            self._expiry_changed.clear()
+            try:
+                await asyncio.wait_for(self._expiry_changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def purge(self, entries):
+        """Remove expired (guild_id, user_id) entries as one batch, written to the store in a single append"""
+        removed = 0
+        for guild_id, user_id in entries:
+            if self._remove(guild_id, user_id, make_event("expire", guild_id, user_id)):
+                removed += 1
+        EXPIRED.inc(removed)
+        if removed:
+            # Skip the debounce, the whole batch is already pending
+            self._flush_requested.set()
+        return removed
+
+    def expiry_snapshot(self):
+        """Return the expiries in the on-disk {"guild_id": [["user_id", expires_at], ...]} layout"""
+        snapshot = {}
+        for (guild_id, user_id), expires_at in sorted(self._expiries.items()):
+            snapshot.setdefault(str(guild_id), []).append([str(user_id), expires_at])
+        return snapshot
+
+    async def history(self, guild_id, user_id, limit=10):
+        """Return who added or removed a user and when, newest first"""
+        return await asyncio.to_thread(self._store.history, guild_id, user_id, limit)
+
+    def _record(self, event):
+        """Queue a change for the store, coalescing bursts into one write"""
+        self._pending.append(event)
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.get_running_loop().create_task(self._save_loop())
+
+    async def flush(self):
+        """Write out any pending changes now (called on shutdown)"""
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            self._expiry_task = None
+        if self._save_task is not None and not self._save_task.done():
+            self._flush_requested.set()
+            await self._save_task
+        if self._pending:
+            # A previous write failed, give it one more try
+            self._flush_requested.set()
+            await self._save_loop()
+
+    async def _save_loop(self):
+        # Debounce: let a burst of changes pile up into a single write
+        try:
+            await asyncio.wait_for(self._flush_requested.wait(), self._save_delay)
+        except asyncio.TimeoutError:
+            pass
+        self._flush_requested.clear()
+
+        while self._pending:
+            events = self._pending
+            self._pending = []
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._store.append, events)
+            except Exception as e:
+                PERSIST_WRITES.labels("append", "error").inc()
+                print(f"Error saving monitored users data: {e}")
+                # Keep the changes pending, the next change or flush retries
+                self._pending[:0] = events
+                return
+            PERSIST_WRITES.labels("append", "ok").inc()
+            PERSIST_SECONDS.labels("append").observe(time.perf_counter() - started)
+
+            if self._store.needs_compaction():
+                # Snapshot on the event loop, write it off it. Changes made
+                # meanwhile land in the next journal and replay cleanly.
+                snapshot = self.to_dict()
+                expiries = self.expiry_snapshot()
+                started = time.perf_counter()
+                try:
+                    await asyncio.to_thread(self._store.compact, snapshot, expiries)
+                except Exception as e:
+                    # The journal still holds everything, retry after the next write
+                    PERSIST_WRITES.labels("compact", "error").inc()
+                    print(f"Error compacting monitored users journal: {e}")
+                else:
+                    PERSIST_WRITES.labels("compact", "ok").inc()
+                    PERSIST_SECONDS.labels("compact").observe(time.perf_counter() - started)
@@ -0,0 +1,108 @@
+import asyncio
+
+import discord
+
+from rest_scheduler import BULK, INTERACTIVE
+
+# Monitored users shown per page of !monitored
+PAGE_SIZE = 20
+
+# Seconds the page buttons stay active after the last use
+VIEW_TIMEOUT = 180
+
+
+def page_count(total):
+    return max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
+
+
+class WatchlistPaginator(discord.ui.View):
+    """Button-driven pages of a guild's watchlist, resolving only the page on screen
+
+    Only the command author can turn pages. The page after the visible one
+    is resolved in the background so "Next" is usually instant.
+    """
+
+    def __init__(self, author_id, guild, user_ids, resolver, expiries=None):
+        super().__init__(timeout=VIEW_TIMEOUT)
+        self.author_id = author_id
+        self.guild = guild
+        self.user_ids = user_ids
+        self.resolver = resolver
+        # user_id -> unix time monitoring ends, for time-bounded entries
+        self.expiries = expiries or {}
+        self.page = 0
+        self.pages = page_count(len(user_ids))
+        self.message = None
+        self._prefetch = None
+
+    def _page_ids(self, page):
+        start = page * PAGE_SIZE
+        return self.user_ids[start:start + PAGE_SIZE]
+
+    async def render(self):
+        """Build the embed for the current page"""
+        user_ids = self._page_ids(self.page)
+        # Someone is waiting for this page, the prefetch below can wait
+        users = await self.resolver.resolve_many(user_ids, self.guild, INTERACTIVE)
+
+        lines = []
+        for user_id, user in zip(user_ids, users):
+            if user:
+                line = f"{user.mention} (`{user.id}`)"
+            else:
+                # User not found or deleted
+                line = f"Unknown User (`{user_id}`)"
+            if user_id in self.expiries:
+                line += f" · until <t:{self.expiries[user_id]}:R>"
+            lines.append(line)
+
+        embed = discord.Embed(
+            title="📋 Monitored Users",
+            description="\n".join(lines),
+            color=discord.Color.blue()
+        )
+        embed.add_field(name="Total Count", value=len(self.user_ids), inline=True)
+        embed.set_footer(text=f"Page {self.page + 1}/{self.pages}")
+
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.pages - 1
+
+        # Warm the cache for the next page while the moderator reads this one
+        if self.page + 1 < self.pages and (self._prefetch is None or self._prefetch.done()):
+            self._prefetch = asyncio.get_running_loop().create_task(
+                self.resolver.resolve_many(self._page_ids(self.page + 1), self.guild, BULK)
+            )
+        return embed
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("Only the moderator who ran this command can change pages.", ephemeral=True)
+            return False
+        return True
+
+    async def _show(self, interaction, page):
+        self.page = max(0, min(page, self.pages - 1))
+        # Resolving may need REST calls, acknowledge the click first
+        await interaction.response.defer()
+        embed = await self.render()
+        await interaction.edit_original_response(embed=embed, view=self)
+
+    @discord.ui.button(label="◀ Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        await self._show(interaction, self.page - 1)
+
+    @discord.ui.button(label="Next ▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        await self._show(interaction, self.page + 1)
+
+    async def on_timeout(self):
+        if self._prefetch is not None:
+            self._prefetch.cancel()
+        if self.message is None:
+            return
+        self.previous_page.disabled = True
+        self.next_page.disabled = True
+        try:
+            await self.message.edit(view=self)
+        except discord.HTTPException:
+            pass
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+
+class WorkerPool:
+    """Fixed number of asyncio workers pulling jobs from a bounded queue
+
+    submit() never waits, so callers such as on_message are not held up by
+    slow jobs. When the queue is full new jobs are dropped and counted.
+    """
+
+    def __init__(self, name, workers, max_queued):
+        self.name = name
+        self.workers = workers
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        self._tasks = []
+        self._started_at = None
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def start(self):
+        """Start the workers (needs a running event loop)"""
+        if self._tasks:
+            return
+        self._started_at = time.monotonic()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, func, *args):
+        """Queue func(*args) to run on a worker, returns False if the queue is full"""
+        try:
+            self._queue.put_nowait((func, args))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    async def _worker(self):
+        while True:
+            func, args = await self._queue.get()
+            self._busy += 1
+            started = time.monotonic()
+            try:
+                await func(*args)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Error in {self.name} worker: {e}")
+            finally:
+                self._busy -= 1
+                self._busy_seconds += time.monotonic() - started
+                self._queue.task_done()
+
+    def stats(self):
+        """Return queue depth and worker utilization for operators"""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0
+        return {
+            "queued": self._queue.qsize(),
+            "max_queued": self._queue.maxsize,
+            "workers": self.workers,
+            "busy": self._busy,
+            # Share of worker time spent running jobs since start
+            "utilization": self._busy_seconds / (elapsed * self.workers) if elapsed else 0.0,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    async def close(self, timeout=5):
+        """Let queued jobs finish (up to timeout seconds), then stop the workers"""
+        if self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []